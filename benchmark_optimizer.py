@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Compare the C++ optimizer extension with its NumPy port.
+#
+# Problems are taken from ElTetrado JSON files (every helix and quadruplex):
+#   ./benchmark_optimizer.py examples/*.json
+# or generated at random:
+#   ./benchmark_optimizer.py --random 200 --levels 2 10
+#
+# Both optimizers are checked to return the same positions.
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+import drawtetrado.optimizer_numpy as optimizer_numpy
+import drawtetrado.structure as structure
+
+# Random helix of num_levels tetrads: strands connecting nucleotides of
+# random levels and tracts for some of the neighbouring levels.
+def RandomProblem(rng, num_levels):
+    num_nucl = num_levels * 4
+    nodes = list(range(num_nucl))
+    rng.shuffle(nodes)
+    edges = [-1] * num_nucl
+    for start, end in zip(nodes, nodes[1:]):
+        if rng.random() < 0.8:
+            edges[start] = end
+    rotations = [-1] * num_levels
+    alignments = [-1] * num_nucl
+    group = 0
+    level = 0
+    while level < num_levels - 1:
+        length = rng.randint(1, num_levels - level)
+        if length > 1 and rng.random() < 0.5:
+            for tract in range(level, level + length):
+                rotations[tract] = group
+                order = list(range(4))
+                if rng.random() < 0.2:
+                    rng.shuffle(order)
+                for index in range(4):
+                    alignments[tract * 4 + order[index]] = group * 4 + index
+            group += 1
+        level += length
+    return edges, rotations, alignments
+
+def ProblemsFromFiles(paths):
+    problems = []
+    for path in paths:
+        struct = structure.Structure().fromFile(path)
+        for idx in range(len(struct.tetrads)):
+            problems.append(structure.Quadruplex(struct, idx).OptimizerInput())
+            if len(struct.single_tetrads[idx]) > 1:
+                for tetrad_idx in range(len(struct.single_tetrads[idx])):
+                    problems.append(structure.Quadruplex(struct, idx, tetrad_idx).OptimizerInput())
+    return problems
+
+def Benchmark(name, module, problems, exact, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [module.solve(*problem, exact) for problem in problems]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{0:>6}: {1:.4f} s ({2:.3f} ms per problem)".format(
+          name, best, 1000.0 * best / max(len(problems), 1)))
+    return [list(result) for result in results]
+
+def main():
+    parser = ArgumentParser("benchmark_optimizer")
+    parser.add_argument("inputs", nargs="*", help="ElTetrado JSON files")
+    parser.add_argument("--random", type=int, default=0,
+                        help="number of random problems to generate")
+    parser.add_argument("--levels", type=int, nargs=2, default=[2, 10],
+                        help="min and max number of levels of random problems")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--exact", action="store_true",
+                        help="use branch-and-bound search")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    problems = ProblemsFromFiles(args.inputs)
+    rng = random.Random(args.seed)
+    for _ in range(args.random):
+        problems.append(RandomProblem(rng, rng.randint(*args.levels)))
+    if len(problems) == 0:
+        parser.error("no problems, provide JSON files or --random")
+    print("{0} problems, {1} levels in total".format(
+          len(problems), sum(len(problem[1]) for problem in problems)))
+
+    numpy_results = Benchmark("numpy", optimizer_numpy, problems, args.exact, args.repeat)
+    try:
+        import optimizer
+    except ImportError:
+        print("C++ optimizer extension is not available.")
+        return
+    cpp_results = Benchmark("c++", optimizer, problems, args.exact, args.repeat)
+    mismatches = sum(1 for a, b in zip(numpy_results, cpp_results) if a != b)
+    print("mismatches: {0}".format(mismatches))
+
+if __name__ == "__main__":
+    main()
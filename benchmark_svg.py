@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Compare the svgwrite and the streaming SVG writers.
+#
+#   ./benchmark_svg.py examples/*.json
+#
+# For each writer: time and peak memory (tracemalloc) per drawing, measured
+# from preparing the drawing to saving it, and size of the output.
+import copy
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+import drawtetrado.structure as structure
+import drawtetrado.svg_painter as svg_painter
+import drawtetrado.svg_writer as svg_writer
+
+# Optimized quadruplexes of every helix and quadruplex of the inputs.
+def Quadruplexes(paths):
+    quadruplexes = []
+    for path in paths:
+        struct = structure.Structure().fromFile(path)
+        for idx in range(len(struct.tetrads)):
+            quadruplexes.append(structure.Quadruplex(struct, idx))
+            if len(struct.single_tetrads[idx]) > 1:
+                for tetrad_idx in range(len(struct.single_tetrads[idx])):
+                    quadruplexes.append(structure.Quadruplex(struct, idx, tetrad_idx))
+    structure.OptimizeAll(quadruplexes)
+    return quadruplexes
+
+def DrawOnce(quadruplex, config, path):
+    svg_maker = svg_painter.SvgMaker(config, path, quadruplex)
+    svg_maker.DrawAll()
+    svg_maker.svg.save(pretty=True)
+
+def Benchmark(writer, quadruplexes, config, directory, repeat):
+    config.svg_writer = writer
+    path = os.path.join(directory, writer + ".svg")
+    total = 0.0
+    peak = 0
+    size = 0
+    for quadruplex in quadruplexes:
+        for _ in range(repeat):
+            # Drawing modifies the quadruplex.
+            fresh = copy.deepcopy(quadruplex)
+            start = time.perf_counter()
+            DrawOnce(fresh, config, path)
+            elapsed = time.perf_counter() - start
+            total += elapsed
+        fresh = copy.deepcopy(quadruplex)
+        tracemalloc.start()
+        DrawOnce(fresh, config, path)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        size += os.path.getsize(path)
+    count = len(quadruplexes) * repeat
+    print("{0:>8}: {1:.3f} ms per drawing, peak memory {2:.1f} KiB, output {3:.1f} KiB".format(
+          writer, 1000.0 * total / count, peak / 1024.0, size / 1024.0))
+
+def main():
+    parser = ArgumentParser("benchmark_svg")
+    parser.add_argument("inputs", nargs="+", help="ElTetrado JSON files")
+    parser.add_argument("--config", default=None, help="drawtetrado config file")
+    parser.add_argument("--precision", type=int, default=svg_writer.DEFAULT_PRECISION,
+                        help="precision of the streaming writer")
+    parser.add_argument("--styling", choices=svg_painter.SVG_STYLINGS, default="inline",
+                        help="styling of SVG elements")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    quadruplexes = Quadruplexes(args.inputs)
+    print("{0} drawings".format(len(quadruplexes)))
+    config = svg_painter.Config(1.0, args.config)
+    config.svg_precision = args.precision
+    config.svg_styling = args.styling
+    with tempfile.TemporaryDirectory() as directory:
+        for writer in svg_writer.WRITERS:
+            Benchmark(writer, quadruplexes, config, directory, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 # cython: language_level=3
-from libcpp.pair cimport pair
+from libc.stdint cimport int32_t, int64_t
 from libcpp.vector cimport vector
 
 cdef extern from "svg_optimizer.cpp":
     cdef cppclass Solution:
         vector[int] positions
         int score
-        vector[pair[int,int]] dangling_edges
+        int64_t explored
+        int64_t pruned
+        vector[int] conflicts
 
-    Solution SolveFailsafe(vector[int]& edges, vector[int]& rotations, vector[int]& alignments)
+    Solution SolveFailsafe(vector[int]& edges, vector[int]& rotations, vector[int]& alignments,
+                           bint exact)
+    void SolveMany(const int32_t* edges, const int32_t* rotations, const int32_t* alignments,
+                   const int64_t* level_offsets, size_t num_problems, int32_t* positions,
+                   int32_t* scores, int32_t* conflicts, int num_threads, bint exact) nogil
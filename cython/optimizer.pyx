@@ -1,7 +1,65 @@
 # distutils: language = c++
-# distutils: extra_compile_args = -std=c++20
+# distutils: extra_compile_args = -std=c++20 -pthread
+# distutils: extra_link_args = -pthread
 
-from optimizer cimport SolveFailsafe
+from cpython cimport array
+from libc.stdint cimport int32_t, int64_t
 
-def solve(edges, rotations, alignments):
-    return SolveFailsafe(edges, rotations, alignments).positions
+import array
+
+from optimizer cimport Solution, SolveFailsafe, SolveMany
+
+def solve(edges, rotations, alignments, exact = False):
+    return SolveFailsafe(edges, rotations, alignments, exact).positions
+
+def solve_stats(edges, rotations, alignments, exact = False):
+    """Same as solve, returns dict with positions, score, search statistics
+    (number of explored and pruned states) and levels which could not be
+    rotated the same way as the previous one according to tracts (conflicts).
+    If there are conflicts, tracts were ignored."""
+    cdef Solution result = SolveFailsafe(edges, rotations, alignments, exact)
+    return {"positions": result.positions, "score": result.score,
+            "explored": result.explored, "pruned": result.pruned,
+            "conflicts": result.conflicts}
+
+def solve_many(const int32_t[::1] edges, const int32_t[::1] rotations,
+               const int32_t[::1] alignments, const int64_t[::1] level_offsets,
+               int num_threads = 0, bint exact = False):
+    """Solve batch of problems without holding the GIL.
+
+    Inputs of all problems are concatenated into int32 buffers (NumPy arrays,
+    array.array('i') or other contiguous buffers). Problem i spans levels
+    level_offsets[i] to level_offsets[i + 1] (int64, num_problems + 1
+    entries), its nucleotide IDs are local to the problem. Problems are solved
+    by num_threads C++ threads (0 - one per core). With exact = True
+    branch-and-bound search finds solutions with the lowest score.
+
+    Returns (positions, scores, conflicts) as array.array('i'); positions are
+    laid out like edges, conflicts like rotations (1 - level conflicts with
+    tracts, which were ignored for its problem).
+    """
+    cdef Py_ssize_t num_problems = level_offsets.shape[0] - 1
+    cdef Py_ssize_t num_levels = rotations.shape[0]
+    cdef Py_ssize_t i
+    if num_problems < 0 or level_offsets[0] != 0 or \
+       level_offsets[num_problems] != num_levels:
+        raise ValueError("level_offsets have to start with 0 and end with number of levels")
+    if edges.shape[0] != num_levels * 4 or alignments.shape[0] != num_levels * 4:
+        raise ValueError("edges and alignments have to contain 4 entries per level")
+    for i in range(num_problems):
+        if level_offsets[i] > level_offsets[i + 1]:
+            raise ValueError("level_offsets have to be non-decreasing")
+
+    cdef array.array positions = array.clone(array.array('i'), num_levels * 4, zero = True)
+    cdef array.array scores = array.clone(array.array('i'), num_problems, zero = True)
+    cdef array.array conflicts = array.clone(array.array('i'), num_levels, zero = True)
+    if num_problems == 0 or num_levels == 0:
+        return positions, scores, conflicts
+
+    with nogil:
+        SolveMany(&edges[0], &rotations[0], &alignments[0], &level_offsets[0],
+                  num_problems, <int32_t*> positions.data.as_ints,
+                  <int32_t*> scores.data.as_ints,
+                  <int32_t*> conflicts.data.as_ints,
+                  num_threads, exact)
+    return positions, scores, conflicts
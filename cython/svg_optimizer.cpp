@@ -1,8 +1,11 @@
 #include <algorithm>
+#include <atomic>
 #include <cmath>
 #include <cstdlib>
 #include <iostream>
+#include <map>
 #include <string>
+#include <thread>
 #include <vector>
 
 #define INF 2e9
@@ -21,11 +24,28 @@ const std::vector<std::vector<Position>> permutations = {
 struct Solution {
   std::vector<Position> positions;
   int score = -1;
-  std::vector<std::pair<ID, ID>> dangling_edges;
+  // Search statistics. Number of generated and pruned states.
+  int64_t explored = 0;
+  int64_t pruned = 0;
+  // Levels which could not be rotated the same way as the previous one
+  // according to tracts. If not empty, tracts were ignored.
+  std::vector<Level> conflicts;
 };
 
 Level LevelOf(ID id) { return id / 4; }
 
+// Penalty for the connection between positions of nucleotides on levels
+// that are not neighbours (or are but positions differ).
+// 0 - 0, 1 - 1, 2 - 2, 3 - 3 LEFT / RIGHT
+// 0 - 1, 2 - 3 LEFT_CROSS / RIGHT_CROSS
+// 0 - 3 FRONT_CROSS, 1 - 2 BACK_CROSS
+// 0 - 2, 1 - 3 FRONT_TO_BACK. // WORST CASE! This connection should not be
+// allowed.
+constexpr int kPenalty[4][4] = {
+    {3, 5, 500, 7}, {5, 3, 4, 500}, {500, 4, 3, 5}, {7, 500, 5, 3}};
+// Lowest value in kPenalty.
+constexpr int kMinPenalty = 3;
+
 // Score is a penalty for the connection. Lower = better.
 int Score(const std::pair<Level, Position> &a,
           const std::pair<Level, Position> &b) {
@@ -35,70 +55,8 @@ int Score(const std::pair<Level, Position> &a,
   } else if (a.second == b.second && std::abs(a.first - b.first) == 1) {
     // SAME_LEVEL. Simple connection up-down 1 level. Best case scenario.
     return 0;
-  } else if ((a.second == 2 && b.second == 2) ||
-             (a.second == 3 && b.second == 3)) {
-    // RIGHT.
-    return 3;
-  } else if ((a.second == 2 && b.second == 3) ||
-             (a.second == 3 && b.second == 2)) {
-    // RIGHT_CROSS.
-    return 5;
-  } else if ((a.second == 0 && b.second == 0) ||
-             (a.second == 1 && b.second == 1)) {
-    // LEFT.
-    return 3;
-  } else if ((a.second == 0 && b.second == 1) ||
-             (a.second == 1 && b.second == 0)) {
-    // LEFT_CROSS.
-    return 5;
-  } else if ((a.second == 0 && b.second == 3) ||
-             (a.second == 3 && b.second == 0)) {
-    // FRONT_CROSS.
-    return 7;
-  } else if ((a.second == 1 && b.second == 2) ||
-             (a.second == 2 && b.second == 1)) {
-    // BACK_CROSS.
-    return 4;
-  } else if ((a.second == 1 && b.second == 3) ||
-             (a.second == 3 && b.second == 1) ||
-             (a.second == 0 && b.second == 2) ||
-             (a.second == 2 && b.second == 0)) {
-    // FRONT_TO_BACK. // WORST CASE! This connection should not be allowed.
-    return 500;
-  }
-
-  // Should not reach this part! Make it worst case?
-  fprintf(stderr, "Scoring unknown connection type? {%hd %hd} -> {%hd %hd}\n",
-          a.first, a.second, b.first, b.second);
-  return 500;
-}
-
-void UpdateScoreForLevel(const std::vector<ID> &edges, Level level,
-                         Solution *solution) {
-  auto score = [&](ID start, ID end) {
-    return Score({LevelOf(start), solution->positions[start]},
-                 {LevelOf(end), solution->positions[end]});
-  };
-  // Add score for dangling edges ending at given level.
-  for (auto &[start, end] : solution->dangling_edges) {
-    if (LevelOf(end) == level) {
-      solution->score += score(start, end);
-    }
-  }
-  // Remove dangling edges
-  auto &d = solution->dangling_edges;
-  std::erase_if(d,
-                [level](const auto &e) { return LevelOf(e.second) == level; });
-  // Add new edges
-  for (Index i = 0; i < 4; ++i) {
-    ID start = level * 4 + i;
-    ID end = edges[start];
-    if (LevelOf(end) > level) {
-      solution->dangling_edges.emplace_back(start, end);
-    } else if (end != -1) {
-      solution->score += score(start, end);
-    }
   }
+  return kPenalty[a.second][b.second];
 }
 
 bool SameLayout(const std::vector<Position> &previous,
@@ -114,91 +72,428 @@ bool SameLayout(const std::vector<Position> &previous,
   return true;
 }
 
-Solution Solve(const std::vector<ID> &edges,
-               const std::vector<Level> &rotations,
-               const std::vector<ID> &alignments) {
-  const int num_levels = edges.size() / 4;
-  std::vector<Solution> current, next;
+// Connection between two nucleotides. It is scored once both of its levels
+// are placed. Until then it is open and the state keeps visual position of
+// the endpoint placed first.
+struct Edge {
+  ID first;  // Endpoint on the lower level.
+  ID second; // Endpoint on the higher level.
+};
+
+// Precomputed bookkeeping of the edges for each level. Open edges are
+// referred to by index in the list of open edges after previous level.
+struct LevelEdges {
+  // Edges with both endpoints on this level.
+  std::vector<Edge> inner;
+  // Open edges closed on this level.
+  std::vector<std::pair<size_t, Edge>> closed;
+  // Open edges after this level. Either kept from previous level (index)
+  // or opened on this level (-1 and the endpoint placed on this level).
+  std::vector<std::pair<int, ID>> open;
+  // Number of edges going up from this or lower levels. Used for pruning.
+  size_t dangling = 0;
+};
+
+std::vector<LevelEdges> PrepareLevelEdges(const std::vector<ID> &edges,
+                                          int num_levels) {
+  std::vector<std::vector<Edge>> starting(num_levels);
+  for (ID start = 0; start < static_cast<ID>(edges.size()); ++start) {
+    ID end = edges[start];
+    if (end == -1) {
+      continue;
+    }
+    if (LevelOf(start) <= LevelOf(end)) {
+      starting[LevelOf(start)].push_back({start, end});
+    } else {
+      starting[LevelOf(end)].push_back({end, start});
+    }
+  }
+
+  std::vector<LevelEdges> levels(num_levels);
+  std::vector<Edge> open_prev;
+  size_t dangling = 0;
+  for (Level level = 0; level < num_levels; ++level) {
+    auto &current = levels[level];
+    std::vector<Edge> open;
+    for (size_t i = 0; i < open_prev.size(); ++i) {
+      if (LevelOf(open_prev[i].second) == level) {
+        current.closed.emplace_back(i, open_prev[i]);
+      } else {
+        current.open.emplace_back(i, -1);
+        open.push_back(open_prev[i]);
+      }
+    }
+    for (const auto &edge : starting[level]) {
+      if (LevelOf(edge.second) == level) {
+        current.inner.push_back(edge);
+      } else {
+        current.open.emplace_back(-1, edge.first);
+        open.push_back(edge);
+      }
+    }
+    // Same as number of dangling edges in the full solution.
+    for (Index i = 0; i < 4; ++i) {
+      if (LevelOf(edges[level * 4 + i]) > level) {
+        dangling++;
+      }
+    }
+    for (const auto &[open_idx, edge] : current.closed) {
+      if (edges[edge.first] == edge.second) {
+        dangling--;
+      }
+    }
+    current.dangling = dangling;
+    open_prev = std::move(open);
+  }
+  return levels;
+}
 
-  for (const auto &perm : permutations) {
-    current.push_back({.positions = perm, .score = 0});
-    UpdateScoreForLevel(edges, 0 /* level 0 */, &current.back());
+// Search state after placing a level. Instead of full permutations only the
+// last one is kept with back-pointer to the state on previous level.
+struct State {
+  int8_t perm;        // Index in permutations.
+  int32_t parent;     // Index of the state on previous level.
+  int score = 0;
+  size_t order = 0;   // Order in which candidate was generated.
+  std::vector<Position> open; // Positions of placed endpoints of open edges.
+};
+
+State Expand(const State &prev, int32_t parent, int8_t perm_idx, Level level,
+             const LevelEdges &level_edges) {
+  const auto &perm = permutations[perm_idx];
+  State next{.perm = perm_idx, .parent = parent, .score = prev.score};
+  for (const auto &edge : level_edges.inner) {
+    next.score += Score({level, perm[edge.first % 4]},
+                        {level, perm[edge.second % 4]});
+  }
+  for (const auto &[open_idx, edge] : level_edges.closed) {
+    next.score += Score({LevelOf(edge.first), prev.open[open_idx]},
+                        {level, perm[edge.second % 4]});
+  }
+  next.open.reserve(level_edges.open.size());
+  for (const auto &[open_idx, id] : level_edges.open) {
+    next.open.push_back(open_idx >= 0 ? prev.open[open_idx] : perm[id % 4]);
   }
+  return next;
+}
 
-  // current.push_back({.positions = {0, 1, 2, 3}, .score = 0});
-  // UpdateScoreForLevel(edges, 0 /* level 0 */, &current.back());
-  // current.push_back({.positions = {0, 3, 2, 1}, .score = 0});
-  // UpdateScoreForLevel(edges, 0 /* level 0 */, &current.back());
+// Lower bound of the score added by levels above each level. Connection
+// spanning more than one level costs at least kMinPenalty, others can be 0.
+std::vector<int> RemainingLowerBound(const std::vector<ID> &edges,
+                                     int num_levels) {
+  std::vector<int> remaining(num_levels, 0);
+  for (ID start = 0; start < static_cast<ID>(edges.size()); ++start) {
+    ID end = edges[start];
+    if (end == -1) {
+      continue;
+    }
+    const Level low = std::min(LevelOf(start), LevelOf(end));
+    const Level high = std::max(LevelOf(start), LevelOf(end));
+    if (high - low < 2) {
+      continue;
+    }
+    for (Level level = 0; level < high; ++level) {
+      remaining[level] += kMinPenalty;
+    }
+  }
+  return remaining;
+}
+
+// Is any level required to be rotated the same way as the previous one?
+bool HasRotationConstraints(const std::vector<Level> &rotations) {
+  for (size_t level = 1; level < rotations.size(); ++level) {
+    if (rotations[level] != -1 && rotations[level] == rotations[level - 1]) {
+      return true;
+    }
+  }
+  return false;
+}
+
+// Search options.
+// beam - drop states much worse than the best one on the level (heuristic).
+// Otherwise drop states that can not beat upper_bound even with the
+// remaining levels scored at their lower_bound (exact).
+// break_symmetry - mirroring all levels (position p -> 3 - p) does not change
+// the score, so only the first half of permutations is tried on the first
+// level. Valid only without rotation constraints.
+struct SearchOptions {
+  bool beam = true;
+  int upper_bound = INF;
+  std::vector<int> lower_bound;
+  bool break_symmetry = false;
+};
+
+Solution Search(const std::vector<ID> &edges,
+                const std::vector<Level> &rotations,
+                const std::vector<ID> &alignments,
+                const std::vector<LevelEdges> &level_edges,
+                const SearchOptions &options) {
+  const int num_levels = level_edges.size();
+  Solution best_solution;
+
+  // Can state on the level still beat the best known solution?
+  auto bounded = [&](const State &state, Level level) {
+    return !options.beam &&
+           state.score + options.lower_bound[level] > options.upper_bound;
+  };
+
+  // (permutation, parent) of the states kept on each level.
+  std::vector<std::vector<std::pair<int8_t, int32_t>>> history(num_levels);
+  std::vector<State> current, next;
+
+  const State root{.perm = -1, .parent = -1};
+  const int8_t first_perms = options.break_symmetry ? 4 : permutations.size();
+  for (int8_t p = 0; p < first_perms; ++p) {
+    State state = Expand(root, -1, p, 0, level_edges[0]);
+    best_solution.explored++;
+    if (bounded(state, 0)) {
+      best_solution.pruned++;
+      continue;
+    }
+    current.push_back(std::move(state));
+    history[0].emplace_back(p, -1);
+  }
 
-  int best_score = INF;
   for (int level = 1; level < num_levels; ++level) {
-    // fprintf(stderr, "Level: %d\n", level);
-    // fprintf(stderr, "Solutions: %lu\n\n", current.size());
+    const bool same_rotation =
+        rotations[level] != -1 && rotations[level] == rotations[level - 1];
+    // Permutation matters for the future only if next level has to be
+    // rotated the same way.
+    const bool keep_perm = level + 1 < num_levels &&
+                           rotations[level + 1] != -1 &&
+                           rotations[level + 1] == rotations[level];
+
+    // States with the same permutation (if it matters) and positions of open
+    // edges have the same future. Only the best one is kept, ties keep the
+    // one generated first.
+    std::map<std::vector<Position>, size_t> merged;
     next.clear();
-    best_score = INF;
-    for (const auto &prev_sol : current) {
-      for (const auto &perm : permutations) {
+    size_t order = 0;
+    int best_score = INF;
+    for (size_t prev_idx = 0; prev_idx < current.size(); ++prev_idx) {
+      const auto &prev_sol = current[prev_idx];
+      for (int8_t p = 0; p < static_cast<int8_t>(permutations.size()); ++p) {
         // Is this level in the same rotation group as the previous one?
-        if (rotations[level] != -1 &&
-            rotations[level] == rotations[level - 1]) {
-
-          if (!SameLayout(
-                  {prev_sol.positions.end() - 4, prev_sol.positions.end()},
-                  perm, alignments, level)) {
-            // Skip this one as it should be rotated the same way as
-            // previous level according to tracts.
-            continue;
-          }
+        if (same_rotation && !SameLayout(permutations[prev_sol.perm],
+                                         permutations[p], alignments, level)) {
+          // Skip this one as it should be rotated the same way as
+          // previous level according to tracts.
+          continue;
+        }
+
+        State candidate = Expand(prev_sol, static_cast<int32_t>(prev_idx), p,
+                                 level, level_edges[level]);
+        candidate.order = order++;
+        best_solution.explored++;
+        if (bounded(candidate, level)) {
+          best_solution.pruned++;
+          continue;
         }
+        best_score = std::min(best_score, candidate.score);
 
-        auto &next_sol = next.emplace_back(prev_sol);
-        next_sol.positions.insert(next_sol.positions.end(), perm.begin(),
-                                  perm.end());
-        UpdateScoreForLevel(edges, level, &next_sol);
-        if (best_score > next_sol.score) {
-          best_score = next_sol.score;
+        std::vector<Position> key;
+        key.reserve(candidate.open.size() + 1);
+        key.push_back(keep_perm ? candidate.perm : -1);
+        key.insert(key.end(), candidate.open.begin(), candidate.open.end());
+        auto [it, inserted] = merged.try_emplace(std::move(key), next.size());
+        if (inserted) {
+          next.push_back(std::move(candidate));
+        } else if (next[it->second].score > candidate.score) {
+          next[it->second] = std::move(candidate);
         }
       }
     }
+
+    // Keep states in the order of generation. It is the lexicographic order
+    // of their permutations, so ties are resolved the same way as when all
+    // solutions are kept.
+    std::sort(next.begin(), next.end(), [](const auto &a, const auto &b) {
+      return a.order < b.order;
+    });
+
     // Drop strictly worse solutions
-    if (next.size() > 0) {
-      int worst_case = best_score + next.back().dangling_edges.size() * 20;
-      std::erase_if(
-          next, [worst_case](const auto &e) { return e.score > worst_case; });
+    const int worst_case = options.beam
+                               ? best_score + level_edges[level].dangling * 20
+                               : INF;
+    current.clear();
+    for (auto &state : next) {
+      if (state.score <= worst_case) {
+        history[level].emplace_back(state.perm, state.parent);
+        current.push_back(std::move(state));
+      } else {
+        best_solution.pruned++;
+      }
     }
-    std::swap(current, next);
   }
 
-  Solution best_solution;
-  best_score = INF;
-
-  for (const auto &solution : current) {
-    if (best_score > solution.score) {
-      best_score = solution.score;
-      best_solution = solution;
+  int best_score = INF;
+  int32_t best_idx = -1;
+  for (size_t i = 0; i < current.size(); ++i) {
+    if (best_score > current[i].score) {
+      best_score = current[i].score;
+      best_idx = static_cast<int32_t>(i);
     }
   }
+  if (best_idx == -1) {
+    return best_solution;
+  }
 
+  // Rebuild permutations following back-pointers.
+  best_solution.score = best_score;
+  best_solution.positions.resize(num_levels * 4);
+  for (int level = num_levels - 1; level >= 0; --level) {
+    const auto &[perm, parent] = history[level][best_idx];
+    std::copy(permutations[perm].begin(), permutations[perm].end(),
+              best_solution.positions.begin() + level * 4);
+    best_idx = parent;
+  }
   return best_solution;
-};
+}
+
+// With exact = false beam search is used. With exact = true its score is
+// used as an upper bound of branch-and-bound search, which returns solution
+// with the lowest possible score.
+Solution Solve(const std::vector<ID> &edges,
+               const std::vector<Level> &rotations,
+               const std::vector<ID> &alignments, bool exact = false) {
+  const int num_levels = edges.size() / 4;
+  if (num_levels == 0) {
+    return {.score = 0};
+  }
+  const auto level_edges = PrepareLevelEdges(edges, num_levels);
+
+  Solution beam = Search(edges, rotations, alignments, level_edges, {});
+  if (!exact) {
+    return beam;
+  }
+
+  SearchOptions options{
+      .beam = false,
+      .upper_bound = beam.score == -1 ? static_cast<int>(INF) : beam.score,
+      .lower_bound = RemainingLowerBound(edges, num_levels),
+      .break_symmetry = !HasRotationConstraints(rotations)};
+  Solution result = Search(edges, rotations, alignments, level_edges, options);
+  result.explored += beam.explored;
+  result.pruned += beam.pruned;
+  return result;
+}
+
+// Levels which can not be rotated the same way as the previous level,
+// as required by tracts. Sets of permutations allowed by the tracts are
+// propagated level by level, so this is cheap compared to the search.
+std::vector<Level> TractConflicts(const std::vector<Level> &rotations,
+                                  const std::vector<ID> &alignments) {
+  std::vector<Level> conflicts;
+  const uint8_t all = (1 << permutations.size()) - 1;
+  uint8_t allowed = all;
+  for (Level level = 1; level < static_cast<Level>(rotations.size());
+       ++level) {
+    if (rotations[level] == -1 || rotations[level] != rotations[level - 1]) {
+      allowed = all;
+      continue;
+    }
+    uint8_t next = 0;
+    for (size_t q = 0; q < permutations.size(); ++q) {
+      if (!(allowed & (1 << q))) {
+        continue;
+      }
+      for (size_t p = 0; p < permutations.size(); ++p) {
+        if (SameLayout(permutations[q], permutations[p], alignments, level)) {
+          next |= 1 << p;
+        }
+      }
+    }
+    if (next == 0) {
+      // Continue as if tracts started here to find other conflicts.
+      conflicts.push_back(level);
+      next = all;
+    }
+    allowed = next;
+  }
+  return conflicts;
+}
 
 Solution SolveFailsafe(const std::vector<ID> &edges,
                        const std::vector<Level> &rotations,
-                       const std::vector<ID> &alignments) {
-  Solution result = Solve(edges, rotations, alignments);
-
-  // tracts are not possible to be implemented.
-  // Recalculate ignoring tracts.
-  if (result.score == -1) {
-    fprintf(stderr, "Unable to include tracts, ignoring.\n");
-    std::vector<Level> rotations_fixed(edges.size(), -1);
-    result = Solve(edges, rotations_fixed, alignments);
+                       const std::vector<ID> &alignments, bool exact = false) {
+  const auto conflicts = TractConflicts(rotations, alignments);
+  if (!conflicts.empty()) {
+    // tracts are not possible to be implemented.
+    // Calculate ignoring tracts.
+    std::vector<Level> rotations_fixed(rotations.size(), -1);
+    Solution result = Solve(edges, rotations_fixed, alignments, exact);
+    result.conflicts = conflicts;
+    return result;
   }
 
+  Solution result = Solve(edges, rotations, alignments, exact);
+  if (result.score == -1 && !exact) {
+    // Tracts can be kept, but beam search dropped all states that allowed
+    // it. Exact search does not drop them. Beam search is not repeated, it
+    // failed, so there is no upper bound.
+    const int num_levels = edges.size() / 4;
+    SearchOptions options{
+        .beam = false,
+        .upper_bound = static_cast<int>(INF),
+        .lower_bound = RemainingLowerBound(edges, num_levels),
+        .break_symmetry = !HasRotationConstraints(rotations)};
+    Solution exact_result =
+        Search(edges, rotations, alignments,
+               PrepareLevelEdges(edges, num_levels), options);
+    exact_result.explored += result.explored;
+    exact_result.pruned += result.pruned;
+    result = std::move(exact_result);
+  }
   return result;
 }
 
-int main() {
+// Solve batch of problems stored in contiguous buffers using num_threads
+// threads (0 - hardware concurrency). Problem i spans levels
+// level_offsets[i] to level_offsets[i + 1]; edges and alignments use
+// nucleotide IDs local to the problem. Positions are written at the same
+// offsets as edges, score of each problem to scores. Levels conflicting
+// with tracts (see TractConflicts) are marked with 1 in conflicts.
+void SolveMany(const int32_t *edges, const int32_t *rotations,
+               const int32_t *alignments, const int64_t *level_offsets,
+               size_t num_problems, int32_t *positions, int32_t *scores,
+               int32_t *conflicts, int num_threads, bool exact = false) {
+  std::atomic<size_t> next_problem = 0;
+  auto worker = [&]() {
+    for (size_t i = next_problem++; i < num_problems; i = next_problem++) {
+      const int64_t begin = level_offsets[i];
+      const int64_t end = level_offsets[i + 1];
+      std::vector<ID> problem_edges(edges + begin * 4, edges + end * 4);
+      std::vector<Level> problem_rotations(rotations + begin, rotations + end);
+      std::vector<ID> problem_alignments(alignments + begin * 4,
+                                         alignments + end * 4);
+      Solution result = SolveFailsafe(problem_edges, problem_rotations,
+                                      problem_alignments, exact);
+      std::copy(result.positions.begin(), result.positions.end(),
+                positions + begin * 4);
+      scores[i] = result.score;
+      for (Level level : result.conflicts) {
+        conflicts[begin + level] = 1;
+      }
+    }
+  };
+
+  if (num_threads <= 0) {
+    num_threads = std::max(1u, std::thread::hardware_concurrency());
+  }
+  num_threads = std::min<size_t>(num_threads, num_problems);
+  std::vector<std::thread> threads;
+  for (int t = 1; t < num_threads; ++t) {
+    threads.emplace_back(worker);
+  }
+  worker();
+  for (auto &thread : threads) {
+    thread.join();
+  }
+}
+
+int main(int argc, char *argv[]) {
+  // --exact selects branch-and-bound search.
+  const bool exact = argc > 1 && std::string(argv[1]) == "--exact";
   std::vector<ID> edges;
   std::vector<Level> rotations;
   std::vector<ID> alignments;
@@ -221,16 +516,9 @@ int main() {
     alignments.push_back(static_cast<ID>(tmp));
   }
 
-  Solution result = Solve(edges, rotations, alignments);
-
-  // tracts are not possible to be implemented.
-  // Recalculate ignoring tracts.
-  if (result.score == -1) {
+  Solution result = SolveFailsafe(edges, rotations, alignments, exact);
+  if (!result.conflicts.empty()) {
     fprintf(stderr, "Unable to include tracts, ignoring.\n");
-    for (auto &rotation : rotations) {
-      rotation = -1;
-    }
-    result = Solve(edges, rotations, alignments);
   }
   printf("%hd", result.positions[0]);
   for (size_t i = 1; i < result.positions.size(); ++i) {
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Generate per-glyph metrics table of bold fonts used for the "table" and
+# "text-length" label metrics modes (src/drawtetrado/data/font_metrics.json).
+#
+# Metrics are measured with cairo for fonts installed in the system:
+#   ./generate_font_metrics.py --family "Arial, Helvetica"
+# or read from Adobe Font Metrics file when fonts are not available:
+#   ./generate_font_metrics.py --family "Arial, Helvetica" --afm phvb8a.afm
+#
+# For every printable ASCII character [advance, xmin, xmax] is stored in
+# units of 1/1000 of the font size.
+import json
+import os
+import string
+import sys
+from argparse import ArgumentParser
+
+UNITS_PER_EM = 1000
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "src", "drawtetrado", "data", "font_metrics.json")
+
+def GlyphsFromCairo(family):
+    import cairo
+    surface = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, None)
+    context = cairo.Context(surface)
+    context.select_font_face(family, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    context.set_font_size(UNITS_PER_EM)
+    glyphs = {}
+    for char in string.printable.strip() + " ":
+        xbearing, ybearing, width, height, xadvance, yadvance = \
+                context.text_extents(char)
+        glyphs[char] = [round(xadvance, 2), round(xbearing, 2),
+                        round(xbearing + width, 2)]
+    return glyphs
+
+AFM_ASCII_NAMES = {"quotesingle": "'", "grave": "`"}
+
+def GlyphsFromAfm(path):
+    glyphs = {}
+    with open(path) as file:
+        for line in file:
+            if not line.startswith("C "):
+                continue
+            fields = {}
+            for entry in line.split(";"):
+                parts = entry.split()
+                if len(parts) > 1:
+                    fields[parts[0]] = parts[1:]
+            code = int(fields["C"][0])
+            name = fields["N"][0]
+            # AdobeStandardEncoding has quoteright and quoteleft at 39 and 96.
+            if name in AFM_ASCII_NAMES:
+                char = AFM_ASCII_NAMES[name]
+            elif code < 32 or code > 126 or code == 39 or code == 96:
+                continue
+            else:
+                char = chr(code)
+            llx, lly, urx, ury = [float(val) for val in fields["B"]]
+            glyphs[char] = [float(fields["WX"][0]), llx, urx]
+    return glyphs
+
+def main():
+    parser = ArgumentParser("generate_font_metrics")
+    parser.add_argument("--family", default="Arial, Helvetica",
+                        help="font family name as used in config.json")
+    parser.add_argument("--afm", default=None,
+                        help="read metrics from AFM file instead of measuring with cairo")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    if args.afm:
+        glyphs = GlyphsFromAfm(args.afm)
+    else:
+        glyphs = GlyphsFromCairo(args.family)
+
+    advances = [val[0] for char, val in glyphs.items() if char.isalnum()]
+    average = round(sum(advances) / len(advances), 2)
+
+    tables = {}
+    if os.path.exists(args.output):
+        with open(args.output) as file:
+            tables = json.load(file)
+    tables[args.family] = {"units-per-em": UNITS_PER_EM,
+                           "default": [average, 0.0, average],
+                           "glyphs": dict(sorted(glyphs.items()))}
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(tables, file, indent=1)
+        file.write("\n")
+    print("{0}: {1} glyphs -> {2}".format(args.family, len(glyphs), args.output),
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
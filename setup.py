@@ -9,10 +9,16 @@ with open('README.md') as f:
 
 os.environ['CFLAGS'] = '-std=c++20'
 
+# Failure to build the optimizer is not fatal, NumPy port of it is used instead.
+ext_modules = cythonize(["cython/optimizer.pyx"])
+for extension in ext_modules:
+    extension.optional = True
+
 setup(name = "drawtetrado",
       version = "1.6.0",
       packages = ['drawtetrado'],
       package_dir = {'': 'src'},
+      package_data = {'drawtetrado': ['data/*.json']},
       author = "Michal Zurkowski",
       author_email = "michal.zurkowski@cs.put.poznan.pl",
       description = "Draw simplified, layer diagrams of quadruplexes.",
@@ -31,10 +37,10 @@ setup(name = "drawtetrado",
           'Programming Language :: Python :: 3',
           'Topic :: Scientific/Engineering :: Bio-Informatics'
       ],
-      ext_modules = cythonize(["cython/optimizer.pyx"]),
+      ext_modules = ext_modules,
       entry_points = {'console_scripts': ['drawtetrado=drawtetrado.main:main']},
       python_requires = '>3.12',
       install_requires = [
-          'pycairo', 'svgwrite', 'orjson', 'eltetrado>=1.7.0', 'rnapolis'
+          'pycairo', 'svgwrite', 'orjson', 'eltetrado>=1.7.0', 'rnapolis', 'numpy'
       ]
 )
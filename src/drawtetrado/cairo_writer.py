@@ -0,0 +1,317 @@
+import io
+import math
+import re
+
+# Cairo writer implementing the same subset of svgwrite as svg_writer, but
+# painting every element straight onto a cairo surface when it is added.
+# Used for PNG and PDF output, without going through SVG.
+#
+# Output formats available for the "format" config option.
+FORMATS = ("svg", "png", "pdf")
+# SVG user unit is 1/96 inch. PNG has dpi / 96 pixels per unit.
+DEFAULT_DPI = 96.0
+# PDF is measured in points, 72 per inch.
+PDF_SCALE = 72.0 / 96.0
+# Defaults of SVG which differ from the cairo ones.
+SVG_MITER_LIMIT = 4.0
+SVG_FONT_SIZE = 16.0
+
+NAMED_COLORS = {"white": (1.0, 1.0, 1.0), "black": (0.0, 0.0, 0.0)}
+TRANSFORM = re.compile(r"(\w+)\s*\(([^)]*)\)")
+
+# (r, g, b) of #RRGGBB or named color, None for "none".
+def ParseColor(value):
+    if value is None or value == "none":
+        return None
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+    return (int(value[1:3], 16) / 255.0, int(value[3:5], 16) / 255.0,
+            int(value[5:7], 16) / 255.0)
+
+def ParseLength(value):
+    if isinstance(value, str):
+        return float(value.replace("px", ""))
+    return float(value)
+
+def TextAnchor(attributes):
+    anchor = attributes.get("text-anchor", "start")
+    style = attributes.get("style", "")
+    for declaration in style.split(";"):
+        name, _, value = declaration.partition(":")
+        if name.strip() == "text-anchor":
+            anchor = value.strip()
+    return anchor
+
+class Element:
+    def __init__(self, tag, attributes, points = None, text = None):
+        self.tag = tag
+        self.attributes = attributes
+        self.points = points
+        self.text = text
+        self.children = []
+
+    def add(self, element):
+        self.children.append(element)
+        return element
+
+class Path(Element):
+    def __init__(self, d, attributes):
+        Element.__init__(self, "path", attributes)
+        self.commands = [d]
+
+    # Same as svgwrite, commands are strings and points are (x, y).
+    def push(self, *elements):
+        self.commands.extend(elements)
+
+class Defs:
+    def __init__(self):
+        self.markers = {}
+
+    # Only markers are used, styles do not apply to cairo output.
+    def add(self, element):
+        if element.tag == "marker":
+            self.markers[element.attributes["id"]] = element
+        return element
+
+class Drawing:
+    # PDF drawings can be pages of a shared surface (see PdfDocument).
+    def __init__(self, filename = None, size = (0, 0), format = "png", dpi = DEFAULT_DPI,
+                 surface = None):
+        import cairo
+        self.cairo = cairo
+        self.filename = filename
+        self.format = format
+        self.defs = Defs()
+        self.buffer = io.BytesIO()
+        self.finished = False
+
+        width, height = size
+        if format == "pdf" and surface is not None:
+            scale = PDF_SCALE
+            self.surface = surface
+            self.surface.set_size(width * scale, height * scale)
+        elif format == "pdf":
+            scale = PDF_SCALE
+            self.surface = cairo.PDFSurface(self.buffer, width * scale, height * scale)
+        elif format == "png":
+            scale = dpi / DEFAULT_DPI
+            self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                              max(int(math.ceil(width * scale)), 1),
+                                              max(int(math.ceil(height * scale)), 1))
+        else:
+            raise ValueError("Unknown cairo output format: " + str(format))
+        self.context = cairo.Context(self.surface)
+        self.context.scale(scale, scale)
+        self.context.set_miter_limit(SVG_MITER_LIMIT)
+        self.line_joins = {"miter": cairo.LINE_JOIN_MITER, "round": cairo.LINE_JOIN_ROUND,
+                           "bevel": cairo.LINE_JOIN_BEVEL}
+
+    # Attributes given as keyword arguments, named as in svgwrite.
+    def Attributes(self, attributes):
+        return {name.rstrip("_").replace("_", "-"): value for name, value in attributes.items()}
+
+    def marker(self, insert, size, orient, markerUnits, id):
+        return Element("marker", {"id": id, "refX": insert[0], "refY": insert[1],
+                                  "markerWidth": size[0], "markerHeight": size[1],
+                                  "orient": orient, "markerUnits": markerUnits})
+
+    def polyline(self, points, **attributes):
+        return Element("polyline", self.Attributes(attributes), points = list(points))
+
+    def polygon(self, points, **attributes):
+        return Element("polygon", self.Attributes(attributes), points = list(points))
+
+    def path(self, d = "", **attributes):
+        return Path(d, self.Attributes(attributes))
+
+    def circle(self, center, r, **attributes):
+        element = Element("circle", self.Attributes(attributes), points = [center])
+        element.attributes["r"] = r
+        return element
+
+    def text(self, text, **attributes):
+        return Element("text", self.Attributes(attributes), text = text)
+
+    def style(self, content):
+        return Element("style", {}, text = content)
+
+    def add(self, element):
+        self.Paint(element)
+        return element
+
+    def Paint(self, element):
+        if element.tag == "polyline":
+            self.DrawPoints(element.points, False)
+            self.FillAndStroke(element.attributes)
+            self.DrawMarkers(element)
+        elif element.tag == "polygon":
+            self.DrawPoints(element.points, True)
+            self.FillAndStroke(element.attributes)
+        elif element.tag == "path":
+            self.DrawPath(element.commands)
+            self.FillAndStroke(element.attributes)
+        elif element.tag == "circle":
+            x, y = element.points[0]
+            self.context.new_sub_path()
+            self.context.arc(x, y, element.attributes["r"], 0.0, 2.0 * math.pi)
+            self.FillAndStroke(element.attributes)
+        elif element.tag == "text":
+            self.DrawText(element)
+
+    def DrawPoints(self, points, close):
+        context = self.context
+        context.move_to(*points[0])
+        for point in points[1:]:
+            context.line_to(*point)
+        if close:
+            context.close_path()
+
+    # Path data of M, L and C commands with absolute points.
+    def DrawPath(self, commands):
+        context = self.context
+        command = None
+        points = []
+        for element in commands:
+            if isinstance(element, str):
+                command = element.strip()
+                points = []
+                continue
+            points.append(element)
+            if command == "M":
+                context.move_to(*points[0])
+                command = "L"
+                points = []
+            elif command == "L":
+                context.line_to(*points[0])
+                points = []
+            elif command == "C" and len(points) == 3:
+                context.curve_to(*points[0], *points[1], *points[2])
+                points = []
+
+    # Fill, then stroke the current path, same as SVG painting order.
+    def FillAndStroke(self, attributes):
+        context = self.context
+        fill = ParseColor(attributes.get("fill", "black"))
+        stroke = ParseColor(attributes.get("stroke", "none"))
+        if fill is not None:
+            context.set_source_rgba(*fill, float(attributes.get("fill-opacity", 1.0)))
+            context.fill_preserve()
+        if stroke is not None:
+            context.set_source_rgba(*stroke, float(attributes.get("stroke-opacity", 1.0)))
+            context.set_line_width(ParseLength(attributes.get("stroke-width", 1.0)))
+            context.set_line_join(self.line_joins[attributes.get("stroke-linejoin", "miter")])
+            context.stroke_preserve()
+        context.new_path()
+
+    # marker-mid with orient="auto" on every inner vertex of the polyline.
+    def DrawMarkers(self, element):
+        reference = element.attributes.get("marker-mid")
+        if reference is None:
+            return
+        marker = self.defs.markers.get(reference[len("url(#"):-1])
+        if marker is None:
+            return
+        points = element.points
+        stroke_width = ParseLength(element.attributes.get("stroke-width", 1.0))
+        for previous, point, following in zip(points, points[1:], points[2:]):
+            incoming = math.atan2(point[1] - previous[1], point[0] - previous[0])
+            outgoing = math.atan2(following[1] - point[1], following[0] - point[0])
+            # Bisector of the incoming and outgoing directions.
+            angle = math.atan2(math.sin(incoming) + math.sin(outgoing),
+                               math.cos(incoming) + math.cos(outgoing))
+            self.DrawMarker(marker, point, angle, stroke_width)
+
+    def DrawMarker(self, marker, point, angle, stroke_width):
+        context = self.context
+        attributes = marker.attributes
+        context.save()
+        context.translate(*point)
+        context.rotate(angle)
+        if attributes["markerUnits"] == "strokeWidth":
+            context.scale(stroke_width, stroke_width)
+        context.translate(-attributes["refX"], -attributes["refY"])
+        context.rectangle(0.0, 0.0, attributes["markerWidth"], attributes["markerHeight"])
+        context.clip()
+        for child in marker.children:
+            self.Paint(child)
+        context.restore()
+
+    def Transform(self, transform):
+        context = self.context
+        for name, arguments in TRANSFORM.findall(transform):
+            values = [float(value) for value in re.split(r"[\s,]+", arguments.strip())]
+            if name == "translate":
+                context.translate(values[0], values[1] if len(values) > 1 else 0.0)
+            elif name == "rotate":
+                context.rotate(math.radians(values[0]))
+            elif name == "skewX":
+                context.transform(self.cairo.Matrix(1.0, 0.0, math.tan(math.radians(values[0])),
+                                                    1.0, 0.0, 0.0))
+            elif name == "scale":
+                context.scale(values[0], values[1] if len(values) > 1 else values[0])
+
+    def DrawText(self, element):
+        context = self.context
+        attributes = element.attributes
+        context.save()
+        self.Transform(attributes.get("transform", ""))
+        weight = self.cairo.FONT_WEIGHT_BOLD if attributes.get("font-weight") == "bold" \
+                 else self.cairo.FONT_WEIGHT_NORMAL
+        context.select_font_face(attributes.get("font-family", "sans-serif"),
+                                 self.cairo.FONT_SLANT_NORMAL, weight)
+        context.set_font_size(ParseLength(attributes.get("font-size", SVG_FONT_SIZE)))
+        advance = context.text_extents(element.text)[4]
+        # textLength with spacingAndGlyphs stretches the whole label.
+        if "textLength" in attributes and advance > 0.0:
+            context.scale(ParseLength(attributes["textLength"]) / advance, 1.0)
+        anchor = TextAnchor(attributes)
+        if anchor == "middle":
+            context.move_to(-advance / 2.0, 0.0)
+        elif anchor == "end":
+            context.move_to(-advance, 0.0)
+        else:
+            context.move_to(0.0, 0.0)
+        context.text_path(element.text)
+        self.FillAndStroke(attributes)
+        context.restore()
+
+    # PNG or PDF document. Surface is finished, nothing can be drawn after.
+    def tobytes(self):
+        if not self.finished:
+            if self.format == "png":
+                self.surface.write_to_png(self.buffer)
+            self.surface.finish()
+            self.finished = True
+        return self.buffer.getvalue()
+
+    def write(self, file, pretty = False):
+        file.write(self.tobytes())
+
+    # pretty is accepted for svgwrite compatibility.
+    def save(self, pretty = False):
+        with open(self.filename, "wb") as file:
+            self.write(file, pretty)
+
+# Multi-page PDF with one drawing per page and an outline with page titles.
+class PdfDocument:
+    def __init__(self):
+        import cairo
+        self.cairo = cairo
+        self.buffer = io.BytesIO()
+        self.surface = cairo.PDFSurface(self.buffer, 1.0, 1.0)
+        self.pages = 0
+
+    def NewPage(self, size):
+        return Drawing(None, size, "pdf", surface = self.surface)
+
+    def EndPage(self, drawing, title):
+        drawing.context.show_page()
+        self.pages += 1
+        # Outlines need cairo 1.16.
+        if hasattr(self.surface, "add_outline"):
+            self.surface.add_outline(self.cairo.PDF_OUTLINE_ROOT, title,
+                                     "page=" + str(self.pages), 0)
+
+    def tobytes(self):
+        self.surface.finish()
+        return self.buffer.getvalue()
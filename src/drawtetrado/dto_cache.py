@@ -0,0 +1,142 @@
+import hashlib
+import os
+import tempfile
+
+# On-disk cache of ElTetrado analysis results (JSON DTO) of PDB and
+# PDBx/mmCIF inputs. Entries are keyed by the hash of the input contents and
+# of all analysis options, so re-rendering already analysed structure skips
+# the analysis. Total size is bounded, least recently used entries (by
+# modification time, updated on every hit) are removed first. Size of the
+# cache is counted once and then tracked per put, the directory is scanned
+# again only when the tracked size exceeds the limit or every RESCAN_PUTS
+# puts, to pick up entries written by other processes.
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+ENTRY_SUFFIX = ".json"
+CHUNK_SIZE = 1024 * 1024
+RESCAN_PUTS = 64
+EVICT_RATIO = 0.9
+
+def DefaultCacheDir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "drawtetrado")
+
+def FileDigest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Format of entries, increased when the way of the analysis changes.
+CACHE_FORMAT = 2
+
+# Versions of the analysis. Results of different versions are not mixed.
+def AnalysisVersion():
+    try:
+        from importlib.metadata import version
+        return "format=" + str(CACHE_FORMAT) + ";eltetrado=" + version("eltetrado") + \
+               ";rnapolis=" + version("rnapolis")
+    except Exception:
+        return "format=" + str(CACHE_FORMAT) + ";unknown"
+
+class DtoCache:
+    def __init__(self, directory = None, max_size = DEFAULT_MAX_SIZE):
+        self.directory = directory if directory else DefaultCacheDir()
+        self.max_size = max_size
+        # Tracked total size of the entries, None until the first put.
+        self.size = None
+        self.puts = 0
+        os.makedirs(self.directory, exist_ok = True)
+
+    def Key(self, path, model, no_reorder, tool, external_files):
+        return self.Keys(path, [model], no_reorder, tool, external_files)[model]
+
+    # Keys of several models of the same input, files are hashed only once.
+    def Keys(self, path, models, no_reorder, tool, external_files):
+        files = [AnalysisVersion(), FileDigest(path)]
+        files.extend(FileDigest(external) for external in external_files)
+        keys = {}
+        for model in models:
+            digest = hashlib.sha256()
+            parts = files[:2] + [str(model), str(no_reorder), str(tool)] + files[2:]
+            for part in parts:
+                digest.update(part.encode())
+                digest.update(b"\0")
+            keys[model] = digest.hexdigest()
+        return keys
+
+    def EntryPath(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    # Cached DTO as JSON bytes or None.
+    def Get(self, key):
+        path = self.EntryPath(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    # Entry is written to a temporary file and renamed, so concurrent
+    # readers never see a partially written entry.
+    def Put(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir = self.directory, suffix = ".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, self.EntryPath(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.Entries())
+        else:
+            self.size += len(data)
+        self.puts += 1
+        if self.size > self.max_size or self.puts % RESCAN_PUTS == 0:
+            self.Evict()
+
+    def Entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    # Remove least recently used entries if the cache exceeds max_size, down
+    # to EVICT_RATIO of it, so the following puts do not evict again.
+    def Evict(self):
+        entries = sorted(self.Entries())
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size * EVICT_RATIO if total > self.max_size else self.max_size
+        for _, size, name in entries:
+            if total <= limit:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size = total
+
+    def Clear(self):
+        for _, _, name in self.Entries():
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        self.size = 0
@@ -1,92 +1,651 @@
-import gzip
-import json
+import copy
+import glob
+import io
+import logging
 import os
+import re
+import shutil
 import sys
 import tempfile
-from argparse import ArgumentParser
-from typing import IO
+import traceback
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, List, NamedTuple, Optional
 
 import orjson
 from eltetrado.analysis import eltetrado
 from eltetrado.dto import generate_dto
+import rnapolis.annotator
 import rnapolis.parser
-from rnapolis.adapter import ExternalTool
+from rnapolis.adapter import ExternalTool, auto_detect_tool, parse_external_output
 
+import drawtetrado.cairo_writer as cairo_writer
+import drawtetrado.dto_cache as dto_cache
+import drawtetrado.model_parser as model_parser
 import drawtetrado.structure as structure
 import drawtetrado.svg_painter as svg_painter
 
 
-def Draw(struct, output_file, config = svg_painter.Config(1.0)):
-    if len(struct.tetrads) == 0:
-        print("No tetrads available in the processed structure!")
-    for idx in range(len(struct.tetrads)):
-        quadruplex = structure.Quadruplex(struct, idx)
-        svg_maker = svg_painter.SvgMaker(config, output_file + "_" + str(idx) + ".svg", \
-                quadruplex)
+def DrawPath(output_file, idx, tetrad_idx = -1, extension = ".svg"):
+    if tetrad_idx >= 0:
+        return output_file + "_" + str(idx) + "_" + str(tetrad_idx) + extension
+    return output_file + "_" + str(idx) + extension
 
-        # OPTIMIZE, Takes argument "optimizer" with location to the optimizer
-        # binary. Default is "./svg_optimizer"
-        quadruplex.Optimize()
+def Extension(config):
+    return "." + config.output_format
 
-        # Prepare + Draw
-        svg_maker.DrawAll()
+# Drawing of a helix (quadruplex == -1) or of a single quadruplex of the
+# helix as SVG, PNG or PDF bytes (config.output_format).
+class RenderedDiagram(NamedTuple):
+    helix: int
+    quadruplex: int
+    data: bytes
+
+# Prepare and draw already optimized quadruplex. Returns the same bytes as
+# saved to the file.
+def RenderQuadruplex(quadruplex, config, id_prefix = ""):
+    svg_maker = svg_painter.SvgMaker(config, None, quadruplex, id_prefix)
+
+    # Prepare + Draw
+    svg_maker.DrawAll()
+
+    if config.output_format != "svg":
+        return svg_maker.svg.tobytes()
+    buffer = io.StringIO()
+    svg_maker.svg.write(buffer, pretty=True)
+    return buffer.getvalue().encode("utf-8")
+
+# Prepare, draw and save already optimized quadruplex.
+def SaveQuadruplex(quadruplex, path, config):
+    with open(path, "wb") as file:
+        file.write(RenderQuadruplex(quadruplex, config))
+    return path
+
+# Draw single helix (tetrad_idx == -1) or single quadruplex from the helix.
+# Returns path to the saved file.
+def DrawQuadruplex(struct, output_file, config, idx, tetrad_idx = -1):
+    quadruplex = structure.Quadruplex(struct, idx, tetrad_idx)
+
+    # OPTIMIZE, Takes argument "optimizer" with location to the optimizer
+    # binary. Default is "./svg_optimizer"
+    quadruplex.Optimize(exact = config.optimizer_exact)
+
+    return SaveQuadruplex(quadruplex, DrawPath(output_file, idx, tetrad_idx, Extension(config)),
+                          config)
+
+# Id of the drawing in combined output, e.g. helix-0 or helix-0-quadruplex-1.
+def DiagramId(idx, tetrad_idx):
+    if tetrad_idx >= 0:
+        return "helix-" + str(idx) + "-quadruplex-" + str(tetrad_idx)
+    return "helix-" + str(idx)
 
-        # Save
-        print("Helix " + str(idx) + " full: " + output_file + "_" + str(idx) + ".svg")
-        svg_maker.svg.save(pretty=True)
+def DiagramTitle(idx, tetrad_idx):
+    if tetrad_idx >= 0:
+        return "Helix " + str(idx) + ", Quadruplex " + str(tetrad_idx)
+    return "Helix " + str(idx) + " full"
 
-        # Also draw single tetrads from quadruplex structure.
+# Ids of elements of drawings combined into one SVG have to be unique.
+def IdPrefix(config, idx, tetrad_idx):
+    if config.combine and config.output_format == "svg":
+        return DiagramId(idx, tetrad_idx) + "-"
+    return ""
+
+# List of (helix, quadruplex) drawings for the structure. Quadruplex -1 is
+# the full helix. Single quadruplexes are drawn only if helix has more than one.
+def DrawJobs(struct):
+    jobs = []
+    for idx in range(len(struct.tetrads)):
+        jobs.append((idx, -1))
         if (len(struct.single_tetrads[idx]) > 1):
             for tetrad_idx in range(len(struct.single_tetrads[idx])):
-                quadruplex = structure.Quadruplex(struct, idx, tetrad_idx)
-                svg_maker = svg_painter.SvgMaker(config, output_file + "_" + str(idx) + \
-                        "_" + str(tetrad_idx) + ".svg", quadruplex)
+                jobs.append((idx, tetrad_idx))
+    return jobs
+
+# Structure and config shared by all drawings done by a worker.
+_render_worker = None
+
+def _InitRenderWorker(struct, config):
+    global _render_worker
+    _render_worker = (struct, config)
+
+def _RenderJob(job):
+    struct, config = _render_worker
+    quadruplex = structure.Quadruplex(struct, job[0], job[1])
+    quadruplex.Optimize(exact = config.optimizer_exact)
+    return RenderQuadruplex(quadruplex, config, IdPrefix(config, job[0], job[1]))
+
+# Draw all helices and their quadruplexes in memory, without writing files
+# or printing. With workers > 1 drawings are done in parallel by a pool of
+# processes. Returns list of RenderedDiagram in the same order as DrawJobs
+# regardless of the number of workers.
+def Render(struct, config = svg_painter.Config(1.0), workers = 1):
+    jobs = DrawJobs(struct)
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers = min(workers, len(jobs)),
+                                 initializer = _InitRenderWorker,
+                                 initargs = (struct, config)) as executor:
+            data = list(executor.map(_RenderJob, jobs))
+    else:
+        # All quadruplexes are optimized with one batch call.
+        quadruplexes = [structure.Quadruplex(struct, idx, tetrad_idx)
+                        for idx, tetrad_idx in jobs]
+        structure.OptimizeAll(quadruplexes, config.optimizer_threads,
+                              exact = config.optimizer_exact)
+        data = [RenderQuadruplex(quadruplex, config, IdPrefix(config, idx, tetrad_idx))
+                for quadruplex, (idx, tetrad_idx) in zip(quadruplexes, jobs)]
+    return [RenderedDiagram(idx, tetrad_idx, svg) for (idx, tetrad_idx), svg in zip(jobs, data)]
+
+def RenderFromString(json, config = svg_painter.Config(1.0), workers = 1):
+    return Render(structure.Structure().fromString(json), config, workers)
+
+SVG_ROOT = re.compile(r"<svg\b[^>]*>")
+SVG_LENGTH = r'\b{0}="([0-9.eE+-]+)'
 
-                # OPTIMIZE, Takes argument "optimizer" with location to the optimizer
-                # binary. Default is "./svg_optimizer"
-                quadruplex.Optimize()
+def SvgSize(root):
+    return (float(re.search(SVG_LENGTH.format("width"), root).group(1)),
+            float(re.search(SVG_LENGTH.format("height"), root).group(1)))
 
-                # Prepare + Draw
-                svg_maker.DrawAll()
+# Drawings stacked vertically in one SVG, each in its own group with id
+# from DiagramId. Index of the drawings (ids, helix, quadruplex and position)
+# is stored as JSON in <metadata id="drawtetrado-index">.
+def CombineSvg(diagrams):
+    groups = []
+    index = []
+    width = 0.0
+    height = 0.0
+    for diagram in diagrams:
+        text = diagram.data.decode("utf-8")
+        root = SVG_ROOT.search(text)
+        diagram_width, diagram_height = SvgSize(root.group(0))
+        diagram_id = DiagramId(diagram.helix, diagram.quadruplex)
+        index.append({"id": diagram_id, "helix": diagram.helix, "quadruplex": diagram.quadruplex,
+                      "x": 0.0, "y": height, "width": diagram_width, "height": diagram_height})
+        groups.append('<g id="{0}" transform="translate(0, {1})">\n{2}\n</g>\n'.format(
+                      diagram_id, height, text[root.start():].strip()))
+        width = max(width, diagram_width)
+        height += diagram_height
 
-                # Save
-                print("Helix " + str(idx) + ", Quadruplex " + str(tetrad_idx) + ": " + output_file + "_" + str(idx) + ".svg")
-                svg_maker.svg.save(pretty=True)
+    metadata = orjson.dumps({"diagrams": index}).decode("utf-8")
+    metadata = metadata.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return ('<?xml version="1.0" encoding="utf-8" ?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" height="{0}" version="1.1" width="{1}">\n'
+            '<metadata id="drawtetrado-index">{2}</metadata>\n'.format(height, width, metadata) +
+            "".join(groups) + "</svg>\n").encode("utf-8")
 
-def DrawFromString(json, output_file, config = svg_painter.Config(1.0)):
-    Draw(structure.Structure().fromString(json), output_file, config)
+# All drawings of the structure in one document: SVG (see CombineSvg) or
+# multi-page PDF with one drawing per page and outline entries with titles
+# from DiagramTitle. Like Render, nothing is written or printed.
+def RenderCombined(struct, config = svg_painter.Config(1.0), workers = 1):
+    if config.output_format == "svg":
+        return CombineSvg(Render(struct, config, workers))
+    if config.output_format != "pdf":
+        raise ValueError("Combined output is available for SVG and PDF, not " +
+                         str(config.output_format))
 
+    # Pages share one surface, so they are drawn in this process.
+    jobs = DrawJobs(struct)
+    quadruplexes = [structure.Quadruplex(struct, idx, tetrad_idx) for idx, tetrad_idx in jobs]
+    structure.OptimizeAll(quadruplexes, config.optimizer_threads,
+                          exact = config.optimizer_exact)
+    document = cairo_writer.PdfDocument()
+    for quadruplex, (idx, tetrad_idx) in zip(quadruplexes, jobs):
+        svg_maker = svg_painter.SvgMaker(config, None, quadruplex, document = document)
+        svg_maker.DrawAll()
+        document.EndPage(svg_maker.svg, DiagramTitle(idx, tetrad_idx))
+    return document.tobytes()
 
-def DrawFromFile(filename_json, output_file, config = svg_painter.Config(1.0)):
-    Draw(structure.Structure().fromFile(filename_json), output_file, config)
+# Draw all helices and their quadruplexes and save them with output template
+# output_file. Returns list of (helix, quadruplex, path) in the same order
+# as DrawJobs. With config.combine all drawings are saved to a single file
+# output_file.svg or .pdf, returned as (None, None, path).
+def Draw(struct, output_file, config = svg_painter.Config(1.0), workers = 1):
+    if len(struct.tetrads) == 0:
+        print("No tetrads available in the processed structure!")
+    if config.combine:
+        path = output_file + Extension(config)
+        with open(path, "wb") as file:
+            file.write(RenderCombined(struct, config, workers))
+        drawings = [(None, None, path)]
+        PrintDrawings(drawings)
+        return drawings
+    drawings = []
+    for diagram in Render(struct, config, workers):
+        path = DrawPath(output_file, diagram.helix, diagram.quadruplex, Extension(config))
+        with open(path, "wb") as file:
+            file.write(diagram.data)
+        drawings.append((diagram.helix, diagram.quadruplex, path))
+    PrintDrawings(drawings)
+    return drawings
+
+def PrintDrawings(drawings):
+    for idx, tetrad_idx, path in drawings:
+        if idx is None:
+            print("All drawings: " + path)
+        else:
+            print(DiagramTitle(idx, tetrad_idx) + ": " + path)
+
+def DrawFromString(json, output_file, config = svg_painter.Config(1.0), workers = 1):
+    return Draw(structure.Structure().fromString(json), output_file, config, workers)
+
+
+def DrawFromFile(filename_json, output_file, config = svg_painter.Config(1.0), workers = 1):
+    return Draw(structure.Structure().fromFile(filename_json), output_file, config, workers)
+
+def StripCompression(path):
+    root, ext = os.path.splitext(path)
+    if ext in structure.DECOMPRESSORS:
+        return root
+    return path
 
 # For ElTetrado
+# Uncompressed files are opened directly. Compressed ones are decompressed in
+# chunks to a private temporary file, removed when the file is closed, so the
+# parsers can rewind it and nothing is written next to the input.
 def handle_input_file(path) -> IO[str]:
     root, ext = os.path.splitext(path)
 
-    if ext == '.gz':
-        root, ext = os.path.splitext(root)
-        file = tempfile.NamedTemporaryFile('w+', suffix=ext)
-        with gzip.open(path, 'rt') as f:
-            file.write(f.read())
-            file.seek(0)
-    else:
-        file = tempfile.NamedTemporaryFile('w+', suffix=ext)
-        with open(path) as f:
-            file.write(f.read())
-            file.seek(0)
-    return file
+    if ext not in structure.DECOMPRESSORS:
+        return open(path)
+
+    file = tempfile.NamedTemporaryFile('w+b', suffix=os.path.splitext(root)[1].lower())
+    with structure.DECOMPRESSORS[ext](path) as stream:
+        shutil.copyfileobj(stream, file)
+    file.flush()
+    file.seek(0)
+    return io.TextIOWrapper(file)
 
+# Number of bytes checked by IsFileJson.
+JSON_SNIFF_SIZE = 1024
+
+# JSON inputs are recognized by the extension (.json, optionally with the
+# extension of the compression) or by the first non-whitespace character of
+# the (decompressed) contents, without parsing the whole file. PDB and
+# PDBx/mmCIF never start with { or [.
 def IsFileJson(path):
-    with open(path) as file:
-        try:
-            data = json.load(file)
-            return True
-        except:
-            print("Provided file is not a .json. Processing file using ElTetrado.")
-            return False
+    if StripCompression(path).lower().endswith('.json'):
+        return True
+    with structure.OpenDecompressed(path) as file:
+        head = file.read(JSON_SNIFF_SIZE)
+    head = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head[:1] in (b'{', b'['):
+        return True
+    print("Provided file is not a .json. Processing file using ElTetrado.")
     return False
 
+
+# Extensions picked up when a directory is given as an input.
+INPUT_EXTENSIONS = ('.json', '.pdb', '.cif', '.ent', '.mmcif')
+
+def AnalyzeStructure(path, model = 1, no_reorder = False, external_files = [],
+                     tool = None):
+    structures = ReadModels(path, [model], fallback = True)
+    if len(structures) == 0:
+        logging.warning(f"No atoms parsed from {path}")
+        structure3d = rnapolis.parser.group_atoms([], {}, {}, {}, False)
+    else:
+        structure3d = next(iter(structures.values()))
+    return AnalyzeStructure3D(path, structure3d, model, no_reorder, external_files, tool)
+
+def AnalyzeStructure3D(path, structure3d, model = 1, no_reorder = False,
+                       external_files = [], tool = None):
+    external_files: List[str] = list(external_files)
+    selected_tool: Optional[ExternalTool] = (
+        ExternalTool(tool) if tool else None
+    )
+
+    if selected_tool is None and external_files:
+        selected_tool = auto_detect_tool(external_files)
+        logging.info(f"Auto-detected external tool: {selected_tool.value}")
+
+    if selected_tool:
+        if not external_files and selected_tool == ExternalTool.MAXIT:
+            external_files = [path]
+        base_interactions = parse_external_output(
+            external_files, selected_tool, structure3d
+        )
+    else:
+        base_interactions = rnapolis.annotator.extract_base_interactions(
+            structure3d, model
+        )
+
+    analysis = eltetrado(
+        base_interactions,
+        structure3d,
+        no_reorder,
+    )
+    return generate_dto(analysis)
+
+# Caches opened by this process, shared by all inputs so the size of the
+# cache is tracked across them.
+_analysis_caches = {}
+
+# Analysis cache or None if it is disabled or not available.
+def AnalysisCache(args):
+    if getattr(args, "no_cache", True):
+        return None
+    key = (args.cache_dir, args.cache_size)
+    try:
+        if key not in _analysis_caches:
+            _analysis_caches[key] = dto_cache.DtoCache(args.cache_dir,
+                                                       args.cache_size * 1024 * 1024)
+        return _analysis_caches[key]
+    except OSError as e:
+        logging.warning(f"Analysis cache is not available: {e}")
+        return None
+
+def CacheKeys(cache, path, models, args):
+    try:
+        return cache.Keys(path, models, args.no_reorder, args.tool, args.external_files)
+    except OSError as e:
+        logging.warning(f"Analysis cache is not available: {e}")
+        return None
+
+def CachePut(cache, key, data):
+    try:
+        cache.Put(key, data)
+    except OSError as e:
+        logging.warning(f"Unable to store analysis in the cache: {e}")
+
+# ElTetrado DTO of PDB or PDBx/mmCIF input as JSON bytes. Results are cached
+# on disk (see dto_cache) unless disabled with --no-cache.
+def AnalyzeStructureJson(path, args):
+    cache = AnalysisCache(args)
+    keys = CacheKeys(cache, path, [args.model], args) if cache is not None else None
+    if keys is not None:
+        data = cache.Get(keys[args.model])
+        if data is not None:
+            print("Using cached ElTetrado analysis of " + path)
+            return data
+
+    data = orjson.dumps(AnalyzeStructure(path, args.model, args.no_reorder,
+                                         args.external_files, args.tool))
+    if keys is not None:
+        CachePut(cache, keys[args.model], data)
+    return data
+
+# Value of -m/--model: model number, "all" or comma separated numbers and
+# ranges, e.g. "1-5,8". Returns the number for a single model, otherwise
+# list of model numbers or None for all models.
+def ParseModels(value):
+    value = value.strip().lower()
+    if value == "all":
+        return None
+    try:
+        if value.isdigit():
+            return int(value)
+        models = []
+        for part in value.split(","):
+            first, sep, last = part.partition("-")
+            first = int(first)
+            last = int(last) if sep else first
+            if last < first:
+                raise ValueError(part)
+            models.extend(range(first, last + 1))
+    except ValueError:
+        raise ArgumentTypeError("invalid model selection: " + value)
+    return list(dict.fromkeys(models))
+
+# Parse PDB or PDBx/mmCIF file once and split it into models. Returns dict of
+# model number -> Structure3D for selected models (all if models is None) in
+# order of the file. With fallback the first model is used if none of the
+# selected models is present, the same way as in rnapolis.
+def ReadModels(path, models = None, fallback = False):
+    with handle_input_file(path) as cif_or_pdb:
+        atoms, modified, sequence_by_entity, is_nucleic_acid_by_entity = \
+            model_parser.ParseAtoms(cif_or_pdb)
+
+    atoms_by_model = {}
+    for atom in atoms:
+        atoms_by_model.setdefault(atom.model, []).append(atom)
+    if models is not None:
+        selected = {model: atoms_by_model[model] for model in models
+                    if model in atoms_by_model}
+        missing = [model for model in models if model not in atoms_by_model]
+        if len(missing) > 0 and len(atoms_by_model) > 0:
+            logging.warning(f"Models not found in {path}: {missing}")
+        if len(selected) == 0 and fallback and len(atoms_by_model) > 0:
+            first = next(iter(atoms_by_model))
+            selected = {first: atoms_by_model[first]}
+        atoms_by_model = selected
+
+    structures = {}
+    for model, model_atoms in atoms_by_model.items():
+        structures[model] = rnapolis.parser.group_atoms(
+            model_parser.FilterModel(model_atoms), modified, sequence_by_entity, is_nucleic_acid_by_entity, False)
+    return structures
+
+def _AnalyzeModel(task):
+    path, structure3d, model, no_reorder, external_files, tool = task
+    return orjson.dumps(AnalyzeStructure3D(path, structure3d, model, no_reorder,
+                                           external_files, tool))
+
+# ElTetrado DTOs of several models of PDB or PDBx/mmCIF input as dict of model
+# number -> JSON bytes. File is parsed once, models missing in the cache are
+# analyzed in parallel by a pool of workers processes.
+def AnalyzeModelsJson(path, models, args, workers = 1):
+    cache = AnalysisCache(args)
+    results = {}
+    if cache is not None and models is not None:
+        keys = CacheKeys(cache, path, models, args)
+        if keys is not None:
+            for model in models:
+                data = cache.Get(keys[model])
+                if data is not None:
+                    results[model] = data
+            if len(results) == len(models):
+                print("Using cached ElTetrado analysis of " + path)
+                return results
+
+    structures = ReadModels(path, models)
+    keys = None
+    if cache is not None:
+        keys = CacheKeys(cache, path, list(structures), args)
+        if keys is not None:
+            for model in structures:
+                if model not in results:
+                    data = cache.Get(keys[model])
+                    if data is not None:
+                        results[model] = data
+    if len(results) > 0:
+        print("Using cached ElTetrado analysis of {0} models of {1}".format(len(results), path))
+
+    tasks = [(path, structure3d, model, args.no_reorder, args.external_files, args.tool)
+             for model, structure3d in structures.items() if model not in results]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as executor:
+            analyzed = list(executor.map(_AnalyzeModel, tasks))
+    else:
+        analyzed = [_AnalyzeModel(task) for task in tasks]
+    for task, data in zip(tasks, analyzed):
+        results[task[2]] = data
+        if keys is not None:
+            CachePut(cache, keys[task[2]], data)
+
+    return {model: results[model] for model in structures}
+
+# Parts of the DTO which affect the drawing. Models with equal keys have
+# identical drawings.
+def DrawingKey(dto):
+    nucleotides = [(nucl["fullName"], nucl["shortName"], nucl["chain"], nucl["index"],
+                    nucl["number"], nucl["glycosidicBond"]) for nucl in dto["nucleotides"]]
+    helices = []
+    for helix in dto["helices"]:
+        quadruplexes = []
+        for quadruplex in helix["quadruplexes"]:
+            tetrads = [(tetrad["id"], tetrad["nt1"], tetrad["nt2"], tetrad["nt3"],
+                        tetrad["nt4"], tetrad["onz"]) for tetrad in quadruplex["tetrads"]]
+            quadruplexes.append((tetrads, quadruplex.get("tracts", [])))
+        pairs = [(pair["tetrad1"], pair["tetrad2"]) for pair in helix["tetradPairs"]]
+        helices.append((quadruplexes, pairs))
+    return orjson.dumps([nucleotides, helices])
+
+def ModelOutputTemplate(output_file, model):
+    return output_file + "_m" + str(model)
+
+# Draw every model of the input with output template <output>_m<model>.
+# Models with the same drawing as one of the previous models are not drawn
+# again, drawings of that model are copied instead.
+def DrawModels(path, output_file, config, args, workers = 1):
+    dtos = AnalyzeModelsJson(path, args.model, args, workers)
+    if len(dtos) == 0:
+        print("No models to process in " + path)
+    drawn = {}
+    for model, data in dtos.items():
+        dto = structure.ParseJson(data)
+        model_output = ModelOutputTemplate(output_file, model)
+        key = DrawingKey(dto)
+        if key in drawn:
+            same_model, same_output, drawings = drawn[key]
+            print("Model " + str(model) + ": same as model " + str(same_model))
+            # Paths differ only in the output template.
+            copies = [(idx, tetrad_idx, model_output + source[len(same_output):])
+                      for idx, tetrad_idx, source in drawings]
+            for (_, _, source), (_, _, path) in zip(drawings, copies):
+                shutil.copyfile(source, path)
+            PrintDrawings(copies)
+            continue
+        print("Model " + str(model) + ":")
+        drawings = Draw(structure.Structure().fromJsonDict(dto), model_output, config, workers)
+        drawn[key] = (model, model_output, drawings)
+
+def InputBasename(path):
+    root, ext = os.path.splitext(StripCompression(os.path.basename(path)))
+    return root
+
+# Output template for a single input. In batch mode template has to
+# contain {name} which is replaced with the input basename.
+def OutputTemplate(path, output_template):
+    if not output_template:
+        root, ext = os.path.splitext(path)
+        return root
+    return output_template.replace("{name}", InputBasename(path))
+
+def ProcessInput(path, output_template, config, args, workers = 1):
+    output_file = OutputTemplate(path, output_template)
+    if IsFileJson(path):
+        DrawFromFile(path, output_file, config, workers)
+    elif not isinstance(args.model, int):
+        DrawModels(path, output_file, config, args, workers)
+    else:
+        DrawFromString(AnalyzeStructureJson(path, args), output_file, config, workers)
+
+def IsInputFile(path):
+    return StripCompression(path).lower().endswith(INPUT_EXTENSIONS)
+
+# Directories may also hold other JSON files, e.g. a config or an error
+# report. Only objects with helices (ElTetrado output) are picked up from
+# them. Files which are not valid JSON are kept, so they are reported.
+def IsEltetradoJson(path):
+    if not StripCompression(path).lower().endswith('.json'):
+        return True
+    try:
+        with structure.OpenDecompressed(path) as file:
+            data = orjson.loads(file.read())
+    except (OSError, EOFError, orjson.JSONDecodeError):
+        return True
+    return isinstance(data, dict) and "helices" in data
+
+# Expand list of paths, directories and glob patterns into a list of files.
+# Order is preserved and duplicates are skipped. Patterns and directories
+# without any input file are appended to unmatched, if given. JSON files in
+# directories are used only if they are ElTetrado output (IsEltetradoJson).
+def ExpandInputs(inputs, input_list = None, unmatched = None):
+    entries = list(inputs)
+    if input_list:
+        with open(input_list) as file:
+            for line in file:
+                line = line.strip()
+                if line != "" and not line.startswith("#"):
+                    entries.append(line)
+
+    paths = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            matches = sorted(os.path.join(entry, name) for name in os.listdir(entry)
+                             if IsInputFile(name))
+            matches = [path for path in matches if IsEltetradoJson(path)]
+        elif not os.path.exists(entry) and glob.has_magic(entry):
+            matches = sorted(glob.glob(entry, recursive = True))
+        else:
+            matches = [entry]
+        if len(matches) == 0 and unmatched is not None:
+            unmatched.append(entry)
+        paths.extend(matches)
+
+    return list(dict.fromkeys(paths))
+
+# Inputs which would be saved with the same output template as an earlier
+# input, e.g. a/X.json and b/X.json or X.cif and X.cif.gz with /tmp/{name}.
+# Returns (paths without them, their errors). The first input is kept, so
+# the later ones neither overwrite its drawings nor race with it for the file.
+def SkipDuplicateOutputs(paths, output_template):
+    outputs = {}
+    kept = []
+    errors = []
+    for path in paths:
+        output_file = OutputTemplate(path, output_template)
+        if output_file in outputs:
+            errors.append({"input": path, "error": "DuplicateOutput",
+                           "message": "output {0} is already used by {1}".format(
+                           output_file, outputs[output_file]), "traceback": ""})
+            continue
+        outputs[output_file] = path
+        kept.append(path)
+    return kept, errors
+
+# Config shared by all inputs processed by a worker. Set once per worker
+# so it is not sent along with every input.
+_worker_config = None
+
+def _InitWorker(config):
+    global _worker_config
+    _worker_config = config
+
+def _ProcessInputSafe(path, output_template, args, config = None, workers = 1):
+    if config is None:
+        config = _worker_config
+    try:
+        ProcessInput(path, output_template, config, args, workers)
+        return None
+    except Exception as e:
+        return {"input": path, "error": type(e).__name__, "message": str(e),
+                "traceback": traceback.format_exc()}
+
+# Process all inputs, either in this process or across a pool of `jobs`
+# worker processes. Single input uses the workers to draw its helices and
+# quadruplexes in parallel. Returns list of per-file errors in input order.
+def ProcessInputs(paths, output_template, config, args, jobs = 1):
+    if jobs <= 1 or len(paths) <= 1:
+        results = [_ProcessInputSafe(path, output_template, args, config, jobs) for path in paths]
+    else:
+        # Workers already use all the cores, each optimizes with one thread.
+        if config.optimizer_threads == 0:
+            config = copy.copy(config)
+            config.optimizer_threads = 1
+        with ProcessPoolExecutor(max_workers = jobs, initializer = _InitWorker,
+                                 initargs = (config,)) as executor:
+            results = list(executor.map(_ProcessInputSafe, paths,
+                                        [output_template] * len(paths),
+                                        [args] * len(paths)))
+
+    errors = [result for result in results if result is not None]
+    for error in errors:
+        print("Failed to process {0}: {1}: {2}".format(error["input"], error["error"],
+              error["message"]), file = sys.stderr)
+    return errors
+
+# Peak resident set size in MiB of this process and of its finished child
+# processes (workers) or None where it is not available.
+def PeakRss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
 def main():
     parser = ArgumentParser('drawtetrado',
         epilog='The output path is a template. Program will generate drawings for each '
@@ -95,17 +654,47 @@ def main():
         'is provided, path and basename of the input file will be used. If it is provided, output_template=/tmp/out, '
         'the resulting files will be /tmp/out_0.svg, with full helix 0, /tmp/out_0_0.svg '
         'and /tmp/out_0_1.svg for each quadruplex in helix 0. Similar files will be created '
-        'for helix 1 with /tmp/out_1.svg and /tmp/out_1_0.svg, /tmp/out_1_1.svg.')
-    parser.add_argument('-i', '--input', help='path to input PDB, PDBx/mmCIF file or JSON generated by ElTetrado. '
-            'If PDB or PDBx/mmCIF file is provided, it will be first analyzed using ElTetrado.')
+        'for helix 1 with /tmp/out_1.svg and /tmp/out_1_0.svg, /tmp/out_1_1.svg. '
+        'When multiple inputs are processed, output_template has to contain {name} which is '
+        'replaced with basename of each input, e.g. /tmp/{name}.')
+    parser.add_argument('-i', '--input', nargs='*', default=[],
+            help='path(s) to input PDB, PDBx/mmCIF file or JSON generated by ElTetrado. '
+            'If PDB or PDBx/mmCIF file is provided, it will be first analyzed using ElTetrado. '
+            'Directories and glob patterns are expanded, those without any input file are '
+            'reported as failed. Inputs with the same output path as an earlier input are '
+            'reported as failed and skipped.')
+    parser.add_argument('--input-list', help='(optional) file with paths to the inputs, one per line',
+            default=None)
     parser.add_argument('-o', '--output-template', help='(optional) path to output SVG file template '
             '[default=input file path and basename]')
     parser.add_argument('--config',
             help='(optional) JSON config file containing all parameter changes and individual nucleotide '
             'coloring overrides',
             default=None)
+    parser.add_argument('--format', choices=cairo_writer.FORMATS, default=None,
+            help='(optional) output format, PNG and PDF are drawn with cairo [default=svg or '
+            'format from the config]')
+    parser.add_argument('--dpi', type=float, default=None,
+            help='(optional) resolution of PNG output, 96 DPI is one pixel per SVG unit [default=96]')
+    parser.add_argument('--combine', action='store_true',
+            help='(optional) save all drawings of an input into a single file <output_template>.svg '
+            '(group per drawing, index in <metadata>) or multi-page .pdf')
+    parser.add_argument('-j', '--jobs', help='(optional) number of worker processes used to process '
+            'multiple inputs or drawings of a single input [default=1]', default=1, type=int)
+    parser.add_argument('--error-report', help='(optional) path to JSON file with list of inputs '
+            'that failed to process', default=None)
+    parser.add_argument('--report-memory', action='store_true',
+            help='(optional) print peak memory usage (RSS) after processing')
+    parser.add_argument('--no-cache', action='store_true',
+            help='(optional) do not use the cache of ElTetrado analysis results')
+    parser.add_argument('--cache-dir', help='(optional) directory of the ElTetrado analysis cache '
+            '[default=$XDG_CACHE_HOME/drawtetrado or ~/.cache/drawtetrado]', default=None)
+    parser.add_argument('--cache-size', help='(optional) maximum size of the ElTetrado analysis '
+            'cache in MiB [default=512]', default=512, type=int)
     # ElTetrado options.
-    parser.add_argument('-m', '--model', help='(optional, ElTetrado) model number to process', default=1, type=int)
+    parser.add_argument('-m', '--model', help='(optional, ElTetrado) model number to process, "all" or '
+            'list of models and ranges, e.g. 1-5,8; each model is drawn with output template '
+            '<output_template>_m<model> [default=1]', default=1, type=ParseModels)
     parser.add_argument('--no-reorder',
                         action='store_true',
                         help='(optional, ElTetrado) chains of bi- and tetramolecular quadruplexes should be reordered to be able to have '
@@ -127,52 +716,50 @@ def main():
     args = parser.parse_args()
 
     config = svg_painter.Config(1.0, args.config)
+    if args.format:
+        config.output_format = args.format
+    if args.dpi:
+        config.dpi = args.dpi
+    if args.combine:
+        config.combine = True
+    if config.combine and config.output_format == "png":
+        parser.error("combined output is available for SVG and PDF only")
 
-    if not args.input:
+    if not args.input and not args.input_list:
         print(parser.print_help())
         sys.exit(1)
 
-    root, ext = os.path.splitext(args.input)
-    if IsFileJson(args.input):
-        if  not args.output_template:
-            DrawFromFile(args.input, root, config)
-        else:
-            DrawFromFile(args.input, args.output_template, config)
-    else:
-        cif_or_pdb = handle_input_file(args.input)
-        structure3d = rnapolis.parser.read_3d_structure(
-            cif_or_pdb, args.model, nucleic_acid_only=False
-        )
+    unmatched = []
+    paths = ExpandInputs(args.input, args.input_list, unmatched)
+    if len(paths) > 1 and args.output_template and "{name}" not in args.output_template:
+        parser.error("output template has to contain {name} when processing multiple inputs")
 
-        external_files: List[str] = args.external_files
-        selected_tool: Optional[ExternalTool] = (
-            ExternalTool(args.tool) if args.tool else None
-        )
+    errors = [{"input": entry, "error": "NoInputFiles", "message": "no input files found",
+               "traceback": ""} for entry in unmatched]
+    paths, duplicates = SkipDuplicateOutputs(paths, args.output_template)
+    errors += duplicates
+    for error in errors:
+        print("Failed to process {0}: {1}: {2}".format(error["input"], error["error"],
+              error["message"]), file = sys.stderr)
+    if len(paths) > 0:
+        errors += ProcessInputs(paths, args.output_template, config, args, args.jobs)
+    else:
+        print("No input files to process.", file = sys.stderr)
 
-        if selected_tool is None and external_files:
-            selected_tool = auto_detect_tool(external_files)
-            logging.info(f"Auto-detected external tool: {selected_tool.value}")
+    if args.error_report:
+        with open(args.error_report, "wb") as file:
+            file.write(orjson.dumps(errors, option = orjson.OPT_INDENT_2))
 
-        if selected_tool:
-            if not external_files and selected_tool == ExternalTool.MAXIT:
-                external_files = [args.input]
-            base_interactions = parse_external_output(
-                external_files, selected_tool, structure3d
-            )
+    if args.report_memory:
+        peak = PeakRss()
+        if peak is None:
+            print("Peak RSS is not available on this platform.", file = sys.stderr)
         else:
-            base_interactions = rnapolis.annotator.extract_base_interactions(
-                structure3d, args.model
-            )
-
-        analysis = eltetrado(
-            base_interactions,
-            structure3d,
-            args.no_reorder,
-        )
-        dto = generate_dto(analysis)
-
-        if  not args.output_template:
-            DrawFromString(orjson.dumps(dto), root, config)
-        else:
-            DrawFromString(orjson.dumps(dto), args.output_template, config)
+            print("Peak RSS: {0:.1f} MiB, workers: {1:.1f} MiB".format(*peak), file = sys.stderr)
 
+    if len(errors) > 0:
+        print("{0} of {1} inputs failed.".format(len(errors),
+              len(paths) + len(unmatched) + len(duplicates)),
+              file = sys.stderr)
+    if len(errors) > 0 or len(paths) == 0:
+        sys.exit(1)
@@ -0,0 +1,144 @@
+import logging
+
+import rnapolis.parser
+from mmcif.io.PdbxExceptions import PdbxError, PdbxSyntaxError
+from mmcif.io.PdbxReader import PdbxReader
+from rnapolis.common import ResidueAuth, ResidueLabel
+from rnapolis.tertiary import Atom
+
+# Atoms of all models of PDB or PDBx/mmCIF file, read the same way as
+# rnapolis.parser.parse_pdb and parse_cif do, but without removal of
+# duplicated and clashing atoms. rnapolis does it for all models at once,
+# ignoring the model number, which leaves only the first model of an
+# ensemble. Use FilterModel on atoms of each model instead.
+#
+# Returns (atoms, modified, sequence_by_entity, is_nucleic_acid_by_entity),
+# same as the rnapolis parsers.
+
+NUCLEIC_ACID_TYPES = ("peptide nucleic acid", "polydeoxyribonucleotide",
+                      "polydeoxyribonucleotide/polyribonucleotide hybrid",
+                      "polyribonucleotide")
+
+def TryParseInt(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def ParseAtoms(cif_or_pdb):
+    if rnapolis.parser.is_cif(cif_or_pdb):
+        return ParseCifAtoms(cif_or_pdb)
+    return ParsePdbAtoms(cif_or_pdb)
+
+def ParsePdbAtoms(pdb):
+    pdb.seek(0)
+    atoms = []
+    modified = {}
+    model = 1
+    for line in pdb.readlines():
+        if line.startswith("MODEL"):
+            model = int(line[10:14].strip())
+        elif line.startswith("ATOM") or line.startswith("HETATM"):
+            insertion_code = line[26] if line[26] != " " else None
+            auth = ResidueAuth(line[21], int(line[22:26].strip()), insertion_code,
+                               line[17:20].strip())
+            atoms.append(Atom(None, None, auth, model, line[12:16].strip(),
+                              float(line[30:38].strip()), float(line[38:46].strip()),
+                              float(line[46:54].strip()), float(line[54:60].strip())))
+        elif line.startswith("MODRES"):
+            auth = ResidueAuth(line[16], int(line[18:22].strip()), line[23], line[12:15])
+            modified[auth] = line[24:27].strip()
+    return atoms, modified, {}, {}
+
+# Rows of the mmCIF category as dicts.
+def Rows(category):
+    if not category:
+        return []
+    attributes = category.getAttributeList()
+    return [dict(zip(attributes, row)) for row in category.getRowList()]
+
+def Label(row, chain_key, number_key, name_key):
+    chain = row.get(chain_key, None)
+    number = TryParseInt(row.get(number_key, None))
+    name = row.get(name_key, None)
+    if chain is None or number is None or name is None:
+        return None
+    return ResidueLabel(chain, number, name)
+
+def Auth(row, insertion_code, chain_key = "auth_asym_id", number_key = "auth_seq_id",
+         name_key = "auth_comp_id"):
+    chain = row.get(chain_key, None)
+    number = TryParseInt(row.get(number_key, None))
+    name = row.get(name_key, None)
+    if chain is None or number is None or name is None:
+        return None
+    return ResidueAuth(chain, number, insertion_code, name)
+
+def ParseCifAtoms(cif):
+    # Read from the open stream. mmcif IoAdapterPy reads by name, writes its
+    # log and decompressed copy of the file next to the input.
+    cif.seek(0)
+    data = []
+    try:
+        PdbxReader(cif).read(data)
+    except (PdbxError, PdbxSyntaxError) as e:
+        logging.warning(f"Unable to parse mmCIF file: {e}")
+        data = []
+    atoms = []
+    modified = {}
+    sequence_by_entity = {}
+    is_nucleic_acid_by_entity = {}
+    if not data:
+        return atoms, modified, sequence_by_entity, is_nucleic_acid_by_entity
+    container = data[0]
+
+    for row in Rows(container.getObj("atom_site")):
+        # mmCIF marks empty values with ?
+        insertion_code = row.get("pdbx_PDB_ins_code", None)
+        if insertion_code == "?":
+            insertion_code = None
+        for key in ("asym_id", "seq_id", "comp_id"):
+            if row.get("label_" + key, None) is None and row.get("auth_" + key, None) is None:
+                raise RuntimeError(f"Cannot parse an atom line without {key}: {row}")
+        label = Label(row, "label_asym_id", "label_seq_id", "label_comp_id")
+        auth = Auth(row, insertion_code)
+        if label is None and auth is None:
+            continue
+        occupancy = row.get("occupancy", ".")
+        atoms.append(Atom(row.get("label_entity_id", None), label, auth,
+                          int(row.get("pdbx_PDB_model_num", "1")), row["label_atom_id"],
+                          float(row["Cartn_x"]), float(row["Cartn_y"]), float(row["Cartn_z"]),
+                          float(occupancy) if occupancy != "." else None))
+
+    for row in Rows(container.getObj("pdbx_struct_mod_residue")):
+        insertion_code = row.get("PDB_ins_code", None)
+        label = Label(row, "label_asym_id", "label_seq_id", "label_comp_id")
+        auth = Auth(row, insertion_code) if insertion_code is not None else None
+        standard_residue_name = row.get("parent_comp_id", "n")
+        if label is not None:
+            modified[label] = standard_residue_name
+        if auth is not None:
+            modified[auth] = standard_residue_name
+
+    for row in Rows(container.getObj("entity_poly")):
+        entity_id = row.get("entity_id", None)
+        type_ = row.get("type", None)
+        sequence = row.get("pdbx_seq_one_letter_code_can", None)
+        if entity_id and type_:
+            is_nucleic_acid_by_entity[entity_id] = type_ in NUCLEIC_ACID_TYPES
+        if entity_id and sequence:
+            sequence_by_entity[entity_id] = sequence.replace("\n", "")
+
+    for row in Rows(container.getObj("entity")):
+        entity_id = row.get("id", None)
+        type_ = row.get("type", None)
+        if entity_id:
+            sequence_by_entity.setdefault(entity_id, "")
+            if type_:
+                is_nucleic_acid_by_entity.setdefault(entity_id, type_ in NUCLEIC_ACID_TYPES)
+    return atoms, modified, sequence_by_entity, is_nucleic_acid_by_entity
+
+# Duplicated (same label, auth and name) and clashing atoms of a single model
+# removed, the atom with higher occupancy is kept.
+def FilterModel(atoms):
+    return rnapolis.parser.filter_clashing_atoms(atoms)
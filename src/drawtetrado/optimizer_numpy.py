@@ -0,0 +1,268 @@
+import array
+
+import numpy as np
+
+# NumPy port of the rotation optimizer (cython/svg_optimizer.cpp), used when
+# the C++ extension is not available. Same contract and same results as the
+# optimizer module: solve, solve_stats and solve_many.
+#
+# States of a level are kept in arrays. All 8 permutations of every state are
+# scored at once with lookup tables, states with equal future are merged and
+# the rest is pruned the same way as in the C++ search.
+
+PERMUTATIONS = np.array([[0, 1, 2, 3], [3, 0, 1, 2], [2, 3, 0, 1], [1, 2, 3, 0],
+                         [2, 1, 0, 3], [3, 2, 1, 0], [0, 3, 2, 1], [1, 0, 3, 2]],
+                        dtype = np.int64)
+NUM_PERMUTATIONS = len(PERMUTATIONS)
+
+# Penalty for the connection between positions on levels which are not
+# neighbours (or are, but positions differ). See Score in svg_optimizer.cpp.
+PENALTY = np.array([[3, 5, 500, 7], [5, 3, 4, 500], [500, 4, 3, 5], [7, 500, 5, 3]],
+                   dtype = np.int64)
+MIN_PENALTY = 3
+INF = 2000000000
+
+def LevelOf(node):
+    return node // 4
+
+# Penalty of the connection between position a on level_a and position b on
+# level_b for all combinations of positions. 4x4 table.
+def ScoreTable(level_a, level_b):
+    if level_a == level_b:
+        return np.zeros((4, 4), dtype = np.int64)
+    table = PENALTY.copy()
+    if abs(level_a - level_b) == 1:
+        np.fill_diagonal(table, 0)
+    return table
+
+# Does permutation p on the level keep tracts of permutation q on previous
+# level? 8x8 table of SameLayout.
+def SameLayoutTable(alignments, level):
+    previous = alignments[PERMUTATIONS + (level - 1) * 4]
+    current = alignments[PERMUTATIONS + level * 4]
+    return (previous[:, None, :] == current[None, :, :]).all(axis = 2)
+
+# Port of PrepareLevelEdges. For each level: score of the inner edges for
+# each permutation, closed edges as (open index, 4x8 score table of previous
+# position and permutation), open edges as (open index or -1, index of the
+# endpoint placed on this level) and number of dangling edges.
+def PrepareLevelEdges(edges, num_levels):
+    starting = [[] for _ in range(num_levels)]
+    for start, end in enumerate(edges):
+        if end == -1:
+            continue
+        if LevelOf(start) <= LevelOf(end):
+            starting[LevelOf(start)].append((start, end))
+        else:
+            starting[LevelOf(end)].append((end, start))
+
+    levels = []
+    open_prev = []
+    dangling = 0
+    for level in range(num_levels):
+        inner = np.zeros(NUM_PERMUTATIONS, dtype = np.int64)
+        closed = []
+        open_edges = []
+        opened = []
+        for idx, (first, second) in enumerate(open_prev):
+            if LevelOf(second) == level:
+                table = ScoreTable(LevelOf(first), level)
+                closed.append((idx, table[:, PERMUTATIONS[:, second % 4]]))
+                if edges[first] == second:
+                    dangling -= 1
+            else:
+                open_edges.append((idx, -1))
+                opened.append((first, second))
+        for first, second in starting[level]:
+            if LevelOf(second) == level:
+                table = ScoreTable(level, level)
+                inner += table[PERMUTATIONS[:, first % 4], PERMUTATIONS[:, second % 4]]
+            else:
+                open_edges.append((-1, first % 4))
+                opened.append((first, second))
+        for index in range(4):
+            if LevelOf(edges[level * 4 + index]) > level:
+                dangling += 1
+        levels.append((inner, closed, open_edges, dangling))
+        open_prev = opened
+    return levels
+
+def RemainingLowerBound(edges, num_levels):
+    remaining = np.zeros(num_levels, dtype = np.int64)
+    for start, end in enumerate(edges):
+        if end == -1:
+            continue
+        low = min(LevelOf(start), LevelOf(end))
+        high = max(LevelOf(start), LevelOf(end))
+        if high - low >= 2:
+            remaining[:high] += MIN_PENALTY
+    return remaining
+
+def HasRotationConstraints(rotations):
+    return any(rotations[level] != -1 and rotations[level] == rotations[level - 1]
+               for level in range(1, len(rotations)))
+
+# Positions of open edges after placing permutations perms on the level.
+def OpenPositions(prev_open, parents, perms, open_edges):
+    columns = []
+    for open_idx, index in open_edges:
+        if open_idx >= 0:
+            columns.append(prev_open[parents, open_idx])
+        else:
+            columns.append(PERMUTATIONS[perms, index])
+    if len(columns) == 0:
+        return np.zeros((len(perms), 0), dtype = np.int64)
+    return np.stack(columns, axis = 1)
+
+# Port of Search. Returns dict with positions, score, explored and pruned.
+def Search(rotations, alignments, level_edges, beam = True, upper_bound = INF,
+           lower_bound = None, break_symmetry = False):
+    num_levels = len(level_edges)
+    stats = {"positions": [], "score": -1, "explored": 0, "pruned": 0}
+
+    # Level 0.
+    inner, closed, open_edges, dangling = level_edges[0]
+    perms = np.arange(4 if break_symmetry else NUM_PERMUTATIONS)
+    parents = np.full(len(perms), -1)
+    scores = inner[perms]
+    open_pos = OpenPositions(None, parents, perms, open_edges)
+    stats["explored"] += len(perms)
+    if not beam:
+        keep = scores + lower_bound[0] <= upper_bound
+        stats["pruned"] += int((~keep).sum())
+        perms, parents, scores, open_pos = perms[keep], parents[keep], scores[keep], open_pos[keep]
+    history = [(perms, parents)]
+
+    for level in range(1, num_levels):
+        inner, closed, open_edges, dangling = level_edges[level]
+        same_rotation = rotations[level] != -1 and rotations[level] == rotations[level - 1]
+        keep_perm = level + 1 < num_levels and rotations[level + 1] != -1 and \
+                    rotations[level + 1] == rotations[level]
+
+        # Candidates in order of generation: previous state major, permutation minor.
+        cand_parents = np.repeat(np.arange(len(perms)), NUM_PERMUTATIONS)
+        cand_perms = np.tile(np.arange(NUM_PERMUTATIONS), len(perms))
+        if same_rotation:
+            allowed = SameLayoutTable(alignments, level)[perms[cand_parents], cand_perms]
+            cand_parents, cand_perms = cand_parents[allowed], cand_perms[allowed]
+        cand_scores = scores[cand_parents] + inner[cand_perms]
+        for open_idx, table in closed:
+            cand_scores += table[open_pos[cand_parents, open_idx], cand_perms]
+        stats["explored"] += len(cand_perms)
+        if not beam:
+            keep = cand_scores + lower_bound[level] <= upper_bound
+            stats["pruned"] += int((~keep).sum())
+            cand_parents, cand_perms, cand_scores = \
+                    cand_parents[keep], cand_perms[keep], cand_scores[keep]
+        if len(cand_perms) == 0:
+            return stats
+        cand_open = OpenPositions(open_pos, cand_parents, cand_perms, open_edges)
+        best_score = cand_scores.min()
+
+        # Merge states with the same permutation (if it matters) and positions
+        # of open edges. Best score wins, ties keep the one generated first.
+        keys = np.column_stack([cand_perms if keep_perm else np.full(len(cand_perms), -1),
+                                cand_open])
+        _, groups = np.unique(keys, axis = 0, return_inverse = True)
+        groups = groups.reshape(-1)
+        order = np.lexsort((np.arange(len(cand_perms)), cand_scores, groups))
+        first = np.ones(len(order), dtype = bool)
+        first[1:] = groups[order[1:]] != groups[order[:-1]]
+        merged = np.sort(order[first])
+
+        # Drop strictly worse solutions
+        if beam:
+            keep = cand_scores[merged] <= best_score + dangling * 20
+            stats["pruned"] += int((~keep).sum())
+            merged = merged[keep]
+        perms, parents = cand_perms[merged], cand_parents[merged]
+        scores, open_pos = cand_scores[merged], cand_open[merged]
+        history.append((perms, parents))
+
+    if len(perms) == 0:
+        return stats
+
+    # Rebuild permutations following back-pointers.
+    best_idx = int(np.argmin(scores))
+    stats["score"] = int(scores[best_idx])
+    positions = [None] * num_levels
+    for level in range(num_levels - 1, -1, -1):
+        level_perms, level_parents = history[level]
+        positions[level] = PERMUTATIONS[level_perms[best_idx]].tolist()
+        best_idx = int(level_parents[best_idx])
+    stats["positions"] = [pos for level_positions in positions for pos in level_positions]
+    return stats
+
+def Solve(edges, rotations, alignments, exact = False):
+    num_levels = len(edges) // 4
+    if num_levels == 0:
+        return {"positions": [], "score": 0, "explored": 0, "pruned": 0}
+    level_edges = PrepareLevelEdges(edges, num_levels)
+
+    beam = Search(rotations, alignments, level_edges)
+    if not exact:
+        return beam
+    result = Search(rotations, alignments, level_edges, beam = False,
+                    upper_bound = INF if beam["score"] == -1 else beam["score"],
+                    lower_bound = RemainingLowerBound(edges, num_levels),
+                    break_symmetry = not HasRotationConstraints(rotations))
+    result["explored"] += beam["explored"]
+    result["pruned"] += beam["pruned"]
+    return result
+
+# Port of TractConflicts.
+def TractConflicts(rotations, alignments):
+    conflicts = []
+    allowed = np.ones(NUM_PERMUTATIONS, dtype = bool)
+    for level in range(1, len(rotations)):
+        if rotations[level] == -1 or rotations[level] != rotations[level - 1]:
+            allowed[:] = True
+            continue
+        allowed = SameLayoutTable(alignments, level)[allowed].any(axis = 0)
+        if not allowed.any():
+            conflicts.append(level)
+            allowed[:] = True
+    return conflicts
+
+def solve_stats(edges, rotations, alignments, exact = False):
+    edges = list(edges)
+    rotations = list(rotations)
+    alignments = np.array(alignments, dtype = np.int64)
+    conflicts = TractConflicts(rotations, alignments)
+    if len(conflicts) > 0:
+        result = Solve(edges, [-1] * len(rotations), alignments, exact)
+        result["conflicts"] = conflicts
+        return result
+
+    result = Solve(edges, rotations, alignments, exact)
+    if result["score"] == -1 and not exact:
+        # Beam search dropped all states keeping the tracts, search again
+        # without it (and without its bound).
+        num_levels = len(edges) // 4
+        exact_result = Search(rotations, alignments, PrepareLevelEdges(edges, num_levels),
+                              beam = False, upper_bound = INF,
+                              lower_bound = RemainingLowerBound(edges, num_levels),
+                              break_symmetry = not HasRotationConstraints(rotations))
+        exact_result["explored"] += result["explored"]
+        exact_result["pruned"] += result["pruned"]
+        result = exact_result
+    result["conflicts"] = []
+    return result
+
+def solve(edges, rotations, alignments, exact = False):
+    return solve_stats(edges, rotations, alignments, exact)["positions"]
+
+def solve_many(edges, rotations, alignments, level_offsets, num_threads = 0,
+               exact = False):
+    positions = array.array('i', [0] * (len(rotations) * 4))
+    scores = array.array('i', [0] * (len(level_offsets) - 1))
+    conflicts = array.array('i', [0] * len(rotations))
+    for i in range(len(level_offsets) - 1):
+        begin, end = level_offsets[i], level_offsets[i + 1]
+        result = solve_stats(edges[begin * 4:end * 4], rotations[begin:end],
+                             alignments[begin * 4:end * 4], exact)
+        positions[begin * 4:end * 4] = array.array('i', result["positions"])
+        scores[i] = result["score"]
+        for level in result["conflicts"]:
+            conflicts[begin + level] = 1
+    return positions, scores, conflicts
@@ -0,0 +1,224 @@
+import array
+import logging
+import warnings
+from collections import OrderedDict
+
+# Memoization of the rotation optimizer.
+#
+# Input of the optimizer (see cython/svg_optimizer.cpp) consists of 3 vectors:
+# edges      - for each nucleotide (level * 4 + index) index of the nucleotide
+#              it is connected to or -1,
+# rotations  - for each level tract group or -1,
+# alignments - for each nucleotide tract group * 4 + subgroup or -1.
+# Group numbers are only compared for equality, so equal topologies are
+# brought to a canonical form (groups numbered in order of appearance) which
+# is solved only once.
+#
+# With exact = False the optimizer uses beam search (original behaviour), with
+# exact = True branch-and-bound search returning the lowest possible score.
+# Mode is a part of the cache key. The lowest score does not depend on the
+# direction in which levels are stacked, so in exact mode the level order with
+# lexicographically smaller encoding is used. Beam search does depend on it
+# and levels are kept in the caller's order.
+
+# Optimizer module: the C++ extension (optimizer) or, if it was not built,
+# NumPy port with the same contract (drawtetrado.optimizer_numpy).
+_optimizer = None
+
+def GetOptimizer():
+    global _optimizer
+    if _optimizer is None:
+        try:
+            import optimizer
+            _optimizer = optimizer
+        except ImportError:
+            import drawtetrado.optimizer_numpy as optimizer_numpy
+            logging.warning("C++ optimizer extension is not available, using NumPy fallback optimizer.")
+            _optimizer = optimizer_numpy
+    return _optimizer
+
+def SetOptimizer(module):
+    global _optimizer
+    _optimizer = module
+    _cache.Clear()
+
+class SolutionCache:
+    def __init__(self, maxsize = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.data = OrderedDict()
+
+    def Get(self, key):
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+        self.misses += 1
+        return None
+
+    def Put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last = False)
+
+    def Info(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "maxsize": self.maxsize, "currsize": len(self.data)}
+
+    def Clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.data.clear()
+
+_cache = SolutionCache()
+
+def CacheInfo():
+    return _cache.Info()
+
+def ClearCache():
+    _cache.Clear()
+
+def SetCacheSize(maxsize):
+    _cache.maxsize = maxsize
+    while len(_cache.data) > maxsize:
+        _cache.data.popitem(last = False)
+
+# Renumber groups in order of the first appearance. -1 (no group) is kept.
+def Relabel(groups):
+    labels = {-1: -1}
+    result = []
+    for group in groups:
+        if group not in labels:
+            labels[group] = len(labels) - 1
+        result.append(labels[group])
+    return tuple(result)
+
+def ReverseLevels(edges, rotations, alignments):
+    num_levels = len(rotations)
+
+    def Flip(node):
+        if node == -1:
+            return -1
+        return (num_levels - 1 - node // 4) * 4 + node % 4
+
+    rev_edges = [-1] * len(edges)
+    rev_alignments = [-1] * len(alignments)
+    for node in range(len(edges)):
+        rev_edges[Flip(node)] = Flip(edges[node])
+        rev_alignments[Flip(node)] = alignments[node]
+    return rev_edges, list(reversed(rotations)), rev_alignments
+
+# Returns canonical key and whether levels were reversed to obtain it.
+def Canonical(edges, rotations, alignments, exact = False):
+    forward = (tuple(edges), Relabel(rotations), Relabel(alignments))
+    if not exact:
+        return forward, False
+    rev_edges, rev_rotations, rev_alignments = ReverseLevels(edges, rotations, alignments)
+    backward = (tuple(rev_edges), Relabel(rev_rotations), Relabel(rev_alignments))
+    if backward < forward:
+        return backward, True
+    return forward, False
+
+# Tracts of the quadruplex can not be kept, diagram was optimized ignoring
+# them. levels - levels which can not be rotated the same way as the previous
+# one, groups - their tract (rotation) groups.
+class TractConflictWarning(UserWarning):
+    def __init__(self, levels, groups):
+        self.levels = levels
+        self.groups = groups
+        super().__init__("Unable to include tracts (groups {0} at levels {1}), ignoring."
+                         .format(groups, levels))
+
+# Returns (positions, levels conflicting with tracts).
+def SolveUncached(edges, rotations, alignments, exact = False):
+    result = SolveStats(edges, rotations, alignments, exact)
+    return tuple(result["positions"]), tuple(result["conflicts"])
+
+# Uncached solution with search statistics: dict with positions, score,
+# number of explored and pruned states and levels conflicting with tracts.
+def SolveStats(edges, rotations, alignments, exact = False):
+    return GetOptimizer().solve_stats(list(edges), list(rotations), list(alignments), exact)
+
+# Positions of the canonical solution in the caller's level order.
+def MapToCaller(positions, reversed_levels, num_levels):
+    if not reversed_levels:
+        return list(positions)
+    result = []
+    for level in range(num_levels):
+        start = (num_levels - 1 - level) * 4
+        result.extend(positions[start:start + 4])
+    return result
+
+# Warn about tract conflicts of the canonical solution. Conflict on a level is
+# between it and the previous one, so in reversed order it is the next one.
+def WarnConflicts(conflicts, reversed_levels, rotations):
+    if len(conflicts) == 0:
+        return
+    if reversed_levels:
+        levels = sorted(len(rotations) - level for level in conflicts)
+    else:
+        levels = list(conflicts)
+    groups = sorted(set(rotations[level] for level in levels))
+    warnings.warn(TractConflictWarning(levels, groups), stacklevel = 3)
+
+# Same contract as optimizer.solve. For each level returns 4 positions.
+def Solve(edges, rotations, alignments, exact = False):
+    key, reversed_levels = Canonical(edges, rotations, alignments, exact)
+    solution = _cache.Get((key, exact))
+    if solution is None:
+        solution = SolveUncached(*key, exact)
+        _cache.Put((key, exact), solution)
+    positions, conflicts = solution
+    WarnConflicts(conflicts, reversed_levels, rotations)
+    return MapToCaller(positions, reversed_levels, len(rotations))
+
+# Returns list of (positions, levels conflicting with tracts).
+def SolveManyUncached(problems, num_threads = 0, exact = False):
+    edges = array.array('i')
+    rotations = array.array('i')
+    alignments = array.array('i')
+    level_offsets = array.array('q', [0])
+    for problem_edges, problem_rotations, problem_alignments in problems:
+        edges.extend(problem_edges)
+        rotations.extend(problem_rotations)
+        alignments.extend(problem_alignments)
+        level_offsets.append(len(rotations))
+
+    positions, scores, conflicts = GetOptimizer().solve_many(edges, rotations, alignments,
+                                                             level_offsets, num_threads, exact)
+    results = []
+    for i in range(len(problems)):
+        begin, end = level_offsets[i], level_offsets[i + 1]
+        results.append((tuple(positions[begin * 4:end * 4]),
+                        tuple(level - begin for level in range(begin, end)
+                              if conflicts[level])))
+    return results
+
+# Solve list of (edges, rotations, alignments) problems. Problems missing in
+# the cache are solved in one batch call, outside of the GIL.
+def SolveMany(problems, num_threads = 0, exact = False):
+    keys = [Canonical(edges, rotations, alignments, exact)
+            for edges, rotations, alignments in problems]
+    missing = []
+    solved = {}
+    for key, _ in keys:
+        solution = _cache.Get((key, exact))
+        if solution is None:
+            if key not in solved:
+                solved[key] = None
+                missing.append(key)
+        else:
+            solved[key] = solution
+    if len(missing) > 0:
+        for key, solution in zip(missing, SolveManyUncached(missing, num_threads, exact)):
+            solved[key] = solution
+            _cache.Put((key, exact), solution)
+
+    results = []
+    for (key, reversed_levels), problem in zip(keys, problems):
+        positions, conflicts = solved[key]
+        WarnConflicts(conflicts, reversed_levels, problem[1])
+        results.append(MapToCaller(positions, reversed_levels, len(problem[1])))
+    return results
@@ -1,78 +1,59 @@
+import bisect
+import bz2
+import gzip
 import json
-import sys
-import math
+import lzma
+import os
 import subprocess
 
+import orjson
+
 from drawtetrado.svg_painter import Point, ConnType, ConnFlow
+import drawtetrado.solver as solver
+
+# Used nucleotides of each chain sorted by index. Built once per quadruplex,
+# connections of the nucleotides are found with binary search.
+class ChainIndex:
+    def __init__(self, used):
+        chains = {}
+        for order, (name, nucl) in enumerate(used.items()):
+            if nucl["chain"] not in chains:
+                chains[nucl["chain"]] = []
+            chains[nucl["chain"]].append((nucl["index"], order, name))
+        self.indices = {}
+        self.names = {}
+        for chain, entries in chains.items():
+            entries.sort()
+            self.indices[chain] = [index for index, _, _ in entries]
+            self.names[chain] = [name for _, _, name in entries]
+
+    # Name of the nucleotide with the next higher index in the chain or "".
+    def Next(self, chain, index):
+        if chain not in self.indices:
+            return ""
+        pos = bisect.bisect_right(self.indices[chain], index)
+        if pos == len(self.indices[chain]):
+            return ""
+        return self.names[chain][pos]
 
 class Nucleotide:
-    def FindConnections(self, used):
+    def FindConnections(self, chain_index):
         # Find to what it is connected.
-        connected_to = ""
-        curr_min = sys.maxsize
-        for name, nucl in used.items():
-            if nucl["index"] > self.index and \
-               curr_min > nucl["index"] and \
-               self.chain == nucl["chain"]:
-                curr_min = nucl["index"]
-                connected_to = name
-        return connected_to
-
-    def Block(self, width, height, angle):
-        self.coords = []
-        self.coords.append(Point(0.0, 0.0))
-        if math.tan(math.radians(angle)) != 0:
-            shift = height / math.tan(math.radians(angle))
-        else:
-            shift = height / math.tan(math.radians(0.01))
-        self.coords.append(Point(shift, -height))
-        self.coords.append(Point(shift + width, -height))
-        self.coords.append(Point(width, 0.0))
-        self.center = Point((shift + width) / 2.0, -height / 2.0)
-
-    def ShiftBlock(self, shift):
-        self.coords[0] += shift
-        self.coords[1] += shift
-        self.coords[2] += shift
-        self.coords[3] += shift
-        self.center += shift
+        return chain_index.Next(self.chain, self.index)
 
+    # Block of the config geometry moved to the position in the quadruplex.
     def CalculateCoordinates(self, conf):
+        geometry = conf.Geometry()
+        coords, center, shift_x, shift_y = \
+            geometry.templates[(self.GetOnzPlusMinus(), self.position)]
         shift = Point(0, 0)
-        tan_val = math.tan(math.radians(conf.angle))
-        sin_val = math.sin(math.radians(conf.angle))
-        cos_val = math.cos(math.radians(conf.angle))
-        tan_val_rev = math.tan(math.radians(90.0 - conf.angle))
-
-        shift.y -= self.tetrade_no * (sin_val * (conf.longer + conf.shorter + conf.spacing) + \
-                                      conf.tetrade_spacing)
-        if self.GetOnzPlusMinus() == "-":
-            width_0 = conf.longer
-            height_0 = sin_val * conf.shorter
-            width_1 = conf.shorter
-            height_1 = sin_val * conf.longer
-        else: # Should be just this: self.onz == "?+": 
-            width_0 = conf.shorter
-            height_0 = sin_val * conf.longer
-            width_1 = conf.longer
-            height_1 = sin_val * conf.shorter
-
-        if self.position == 0:
-            self.Block(width_0, height_0, conf.angle)
-        elif self.position == 1:
-            self.Block(width_1, height_1, conf.angle)
-            shift.y -= (width_1 + conf.spacing) * sin_val
-            shift.x += (width_1 + conf.spacing) * cos_val
-        elif self.position == 2:
-            self.Block(width_0, height_0, conf.angle)
-            shift.y -= (width_0 + conf.spacing) * sin_val
-            shift.x += (width_1 + conf.spacing) + \
-                       ((width_0 + conf.spacing) * sin_val) * tan_val_rev
-        elif self.position == 3:
-            self.Block(width_1, height_1, conf.angle)
-            shift.x += width_0 + conf.spacing
-
-        self.ShiftBlock(shift)
+        shift.y -= self.tetrade_no * geometry.tetrad_step
+        if shift_y is not None:
+            shift.y -= shift_y
+        if shift_x is not None:
+            shift.x += shift_x
+        self.coords = [coord + shift for coord in coords]
+        self.center = center + shift
 
     def GetOnzPlusMinus(self):
         if self.onz_full[-1] == "-":
@@ -92,7 +73,7 @@ class Nucleotide:
             return "onz_default"
         return res
 
-    def __init__(self, data, used_nucl, tetr_no, tetr_onz, pos):
+    def __init__(self, data, chain_index, tetr_no, tetr_onz, pos):
         self.number = data["number"]
         self.short_name = data["shortName"]
         self.full_name = data["fullName"]
@@ -103,7 +84,7 @@ class Nucleotide:
         self.bond = data["glycosidicBond"]
         self.tetrade_no = tetr_no
         self.position = pos
-        self.connected_to = self.FindConnections(used_nucl)
+        self.connected_to = self.FindConnections(chain_index)
         self.connected_from = ""
         self.coords = []
         self.center = Point(0, 0)
@@ -174,7 +155,7 @@ class Quadruplex:
             tetrads = structure.tetrads[quadruplex_id]
         tetrads_order = structure.tetrads_order[quadruplex_id]
 
-        used_nucl = self.UsedNucleotides(tetrads, nucl)
+        self.chain_index = ChainIndex(self.UsedNucleotides(tetrads, nucl))
 
         tetr_no = 0
         for tetrad_name in tetrads_order:
@@ -188,41 +169,29 @@ class Quadruplex:
             nt4 = tetrad["nt4"]
             onz = tetrad["onz"]
 
-            self.nucl_quad[nt1] = Nucleotide(nucl[nt1], used_nucl, tetr_no, onz, 0)
-            self.nucl_quad[nt2] = Nucleotide(nucl[nt2], used_nucl, tetr_no, onz, 1)
-            self.nucl_quad[nt3] = Nucleotide(nucl[nt3], used_nucl, tetr_no, onz, 2)
-            self.nucl_quad[nt4] = Nucleotide(nucl[nt4], used_nucl, tetr_no, onz, 3)
+            self.nucl_quad[nt1] = Nucleotide(nucl[nt1], self.chain_index, tetr_no, onz, 0)
+            self.nucl_quad[nt2] = Nucleotide(nucl[nt2], self.chain_index, tetr_no, onz, 1)
+            self.nucl_quad[nt3] = Nucleotide(nucl[nt3], self.chain_index, tetr_no, onz, 2)
+            self.nucl_quad[nt4] = Nucleotide(nucl[nt4], self.chain_index, tetr_no, onz, 3)
 
             self.tetrads.append([nt1, nt2, nt3, nt4])
 
             tetr_no = tetr_no + 1
 
 
+    # First and last nucleotide of each chain (in order of appearance) and
+    # connected_from of the nucleotides, taken from the chain index.
     def GetChainFirstLast(self):
         chains = {}
         for _, nucl in self.nucl_quad.items():
-            if nucl.chain not in chains:
-                chains[nucl.chain] = {"first": "",\
-                                      "last": "", \
-                                      "val": sys.maxsize }
-        # Analyze 
-        curr_name = ""
-        curr_min = sys.maxsize
-        for name, nucl in self.nucl_quad.items():
-            if chains[nucl.chain]["val"] > nucl.index:
-                chains[nucl.chain]["val"] = nucl.index
-                chains[nucl.chain]["first"] = name
-
-        # Full connected_from variables.
-        for chain, data in chains.items():
-            curr_name = data["first"]
-            next_conn = self.nucl_quad[data["first"]].connected_to
-            while next_conn != "":
-                self.nucl_quad[next_conn].connected_from = curr_name
-                curr_name = next_conn
-                next_conn = self.nucl_quad[next_conn].connected_to
-            data["last"] = curr_name
-
+            if nucl.chain in chains:
+                continue
+            names = self.chain_index.names[nucl.chain]
+            chains[nucl.chain] = {"first": names[0],
+                                  "last": names[-1],
+                                  "val": self.chain_index.indices[nucl.chain][0]}
+            for prev_name, name in zip(names, names[1:]):
+                self.nucl_quad[name].connected_from = prev_name
         return chains
 
     def __init__(self, structure, quadruplex_id, tetrad_id = -1):
@@ -236,6 +205,17 @@ class Quadruplex:
             self.tracts = single_tracts
         else:
             self.tracts = structure.tracts[quadruplex_id]
+        self.tract_index = self.TractIndex()
+
+    # Nucleotide name -> (group, subgroup) of the tract it belongs to. If it is
+    # listed in many tracts, the last one is used.
+    def TractIndex(self):
+        index = {}
+        for group, tetrad_tracts in enumerate(self.tracts):
+            for subgroup, names in enumerate(tetrad_tracts):
+                for nucl_name in names:
+                    index[nucl_name] = (group, subgroup)
+        return index
 
     def GetNucleotidesPositions(self):
         lst = [-1] * len(self.nucl_quad)
@@ -251,30 +231,30 @@ class Quadruplex:
         lst = [-1] * len(self.tetrads)
         for idx, tetrad in enumerate(self.tetrads):
             for name in tetrad:
-                for group, tetrad_tracts in enumerate(self.tracts):
-                    for names in tetrad_tracts:
-                        for nucl_name in names:
-                            if name == nucl_name:
-                                lst[idx] = group
+                if name in self.tract_index:
+                    lst[idx] = self.tract_index[name][0]
         return lst
 
     def GetAlignments(self):
         lst = [-1] * len(self.nucl_quad)
         for name, nucl in self.nucl_quad.items():
-            for group_1, tetrad_tracts in enumerate(self.tracts):
-                for group_2, names in enumerate(tetrad_tracts):
-                    for nucl_name in names:
-                        if name == nucl_name:
-                            lst[nucl.tetrade_no * 4 + nucl.position] = group_1 * 4 + group_2
+            if name in self.tract_index:
+                group_1, group_2 = self.tract_index[name]
+                lst[nucl.tetrade_no * 4 + nucl.position] = group_1 * 4 + group_2
         return lst
 
-    # Use C++ code to rotate tetrads for more readable output.
-    def Optimize(self, optimizer = "./svg_optimizer"):
-        import optimizer
-        optimized = optimizer.solve(self.GetNucleotidesPositions(),
-                                    self.GetSameRotations(),
-                                    self.GetAlignments())
+    # Use C++ code to rotate tetrads for more readable output. Solutions are
+    # memoized, equal topologies are solved once per process. With exact
+    # branch-and-bound search is used instead of the beam search.
+    def Optimize(self, optimizer = "./svg_optimizer", exact = False):
+        self.ApplyOptimized(solver.Solve(*self.OptimizerInput(), exact))
+
+    # Input of the optimizer: edges, rotations and alignments.
+    def OptimizerInput(self):
+        return (self.GetNucleotidesPositions(), self.GetSameRotations(),
+                self.GetAlignments())
 
+    def ApplyOptimized(self, optimized):
         # Update position for nucleotide.
         for _, nucl in self.nucl_quad.items():
             pos = nucl.position + nucl.tetrade_no * 4
@@ -343,10 +323,24 @@ class Quadruplex:
             #print(nucl.full_name, nucl.flow_out, nucl.flow_in)
             nucl = conn
 
-    # TODO Optimize. Do I rly need so many iterations?
-    # I HAVE TO FIX IT!! it "works"
-    def CalculateFlow(self, chain):
+    # Flow of the connections up or down. Chains are independent, so flows are
+    # resolved separately for each chain with a fixed number of passes over
+    # its nucleotides, linear in the size of the quadruplex.
+    def CalculateFlows(self):
+        # Nucleotides of each chain in order of nucl_quad.
+        chain_nucl = {}
         for _, nucl in self.nucl_quad.items():
+            if nucl.chain not in chain_nucl:
+                chain_nucl[nucl.chain] = []
+            chain_nucl[nucl.chain].append(nucl)
+
+        for chain_name in self.chains:
+            self.CalculateChainFlow(chain_name, chain_nucl[chain_name])
+
+    # Connections between the same positions of neighbouring levels. If
+    # nucleotide has two of them, the later one in nucl_quad wins.
+    def VerticalFlows(self, nucleotides):
+        for nucl in nucleotides:
             # Check if it is not the last nucleotide.
             if nucl.connected_to != "":
                 conn = self.nucl_quad[nucl.connected_to]
@@ -367,8 +361,9 @@ class Quadruplex:
                         nucl.flow_in = ConnFlow.DOWN
                         conn.flow_out = ConnFlow.DOWN
 
-
-        for _, nucl in self.nucl_quad.items():
+    # Unknown flow into the next nucleotide is opposite to its known flow out.
+    def FlowInFromNext(self, nucleotides):
+        for nucl in nucleotides:
             # Check if it is not the last nucleotide.
             if nucl.connected_to != "" and nucl.flow_in == ConnFlow.UNKNOWN:
                 conn = self.nucl_quad[nucl.connected_to]
@@ -377,10 +372,16 @@ class Quadruplex:
                 elif conn.flow_out == ConnFlow.DOWN:
                     nucl.flow_in = ConnFlow.UP
 
-        nucl = self.nucl_quad[chain["first"]]
-        while nucl.connected_to != "":
-            conn = self.nucl_quad[nucl.connected_to]
+    # nucleotides - nucleotides of the chain in order of nucl_quad.
+    def CalculateChainFlow(self, chain_name, nucleotides):
+        # Nucleotides in order of the chain.
+        chain_order = [self.nucl_quad[name] for name in self.chain_index.names[chain_name]]
 
+        self.VerticalFlows(nucleotides)
+        self.FlowInFromNext(nucleotides)
+
+        for nucl in chain_order[:-1]:
+            conn = self.nucl_quad[nucl.connected_to]
             if nucl.flow_in == ConnFlow.UNKNOWN:
                 level_difference = nucl.tetrade_no - conn.tetrade_no
                 if level_difference < 0:
@@ -391,19 +392,10 @@ class Quadruplex:
                     # Connection top to bot
                     nucl.flow_in = ConnFlow.UP
                     conn.flow_out = ConnFlow.DOWN
-            nucl = conn
 
-        for _, nucl in self.nucl_quad.items():
-            # Check if it is not the last nucleotide.
-            if nucl.connected_to != "" and nucl.flow_in == ConnFlow.UNKNOWN:
-                conn = self.nucl_quad[nucl.connected_to]
-                if conn.flow_out == ConnFlow.UP:
-                    nucl.flow_in = ConnFlow.DOWN
-                elif conn.flow_out == ConnFlow.DOWN:
-                    nucl.flow_in = ConnFlow.UP
+        self.FlowInFromNext(nucleotides)
 
-        nucl = self.nucl_quad[chain["first"]]
-        while nucl.connected_to != "":
+        for nucl in chain_order[:-1]:
             conn = self.nucl_quad[nucl.connected_to]
             if nucl.flow_in == ConnFlow.UNKNOWN:
                 nucl.flow_in = nucl.flow_out
@@ -411,10 +403,8 @@ class Quadruplex:
                     conn.flow_out = ConnFlow.DOWN
                 elif nucl.flow_out == ConnFlow.DOWN:
                     conn.flow_out = ConnFlow.UP
-            nucl = conn
 
-        nucl = self.nucl_quad[chain["last"]]
-        while nucl.connected_from != "":
+        for nucl in reversed(chain_order[1:]):
             conn = self.nucl_quad[nucl.connected_from]
             if conn.flow_out == ConnFlow.UNKNOWN:
                 level_difference = nucl.tetrade_no - conn.tetrade_no
@@ -426,19 +416,11 @@ class Quadruplex:
                     conn.flow_out = ConnFlow.UP
                 else:
                     conn.flow_out = conn.flow_in
-            nucl = conn
 
-        for _, nucl in self.nucl_quad.items():
-            # Check if it is not the last nucleotide.
-            if nucl.connected_to != "" and nucl.flow_in == ConnFlow.UNKNOWN:
-                conn = self.nucl_quad[nucl.connected_to]
-                if conn.flow_out == ConnFlow.UP:
-                    nucl.flow_in = ConnFlow.DOWN
-                elif conn.flow_out == ConnFlow.DOWN:
-                    nucl.flow_in = ConnFlow.UP
+        self.FlowInFromNext(nucleotides)
 
         # Determine starting flow.
-        nucl = self.nucl_quad[chain["first"]]
+        nucl = chain_order[0]
         if nucl.connected_to != "":
             conn = self.nucl_quad[nucl.connected_to]
             level_difference = nucl.tetrade_no - conn.tetrade_no
@@ -451,17 +433,9 @@ class Quadruplex:
             else:
                 nucl.flow_out = nucl.flow_in
 
-            for _, nucl in self.nucl_quad.items():
-                # Check if it is not the last nucleotide.
-                if nucl.connected_to != "" and nucl.flow_in == ConnFlow.UNKNOWN:
-                    conn = self.nucl_quad[nucl.connected_to]
-                    if conn.flow_out == ConnFlow.UP:
-                        nucl.flow_in = ConnFlow.DOWN
-                    elif conn.flow_out == ConnFlow.DOWN:
-                        nucl.flow_in = ConnFlow.UP
+            self.FlowInFromNext(nucleotides)
 
-        nucl = self.nucl_quad[chain["first"]]
-        while nucl.connected_to != "":
+        for nucl in chain_order[:-1]:
             conn = self.nucl_quad[nucl.connected_to]
             if nucl.flow_in == ConnFlow.UNKNOWN:
                 if nucl.flow_out == ConnFlow.UNKNOWN:
@@ -478,10 +452,94 @@ class Quadruplex:
                     conn.flow_out = ConnFlow.DOWN
                 elif nucl.flow_out == ConnFlow.DOWN:
                     conn.flow_out = ConnFlow.UP
-            nucl = conn
 
         #print("\n\n")
-        #self.PrintFlow(chain)
+        #self.PrintFlow(self.chains[chain_name])
+
+# Optimize many quadruplexes with a single batch call of the optimizer.
+def OptimizeAll(quadruplexes, num_threads = 0, exact = False):
+    solutions = solver.SolveMany([quad.OptimizerInput() for quad in quadruplexes],
+                                 num_threads, exact)
+    for quad, optimized in zip(quadruplexes, solutions):
+        quad.ApplyOptimized(optimized)
+
+# Compressed inputs, opened as binary streams. Zstandard requires optional
+# zstandard module.
+def OpenZstd(path):
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstandard module is required to read " + path)
+    return zstandard.open(path, 'rb')
+
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open, '.zst': OpenZstd}
+# For files without the extension of the compression.
+COMPRESSION_MAGIC = {'.gz': b'\x1f\x8b', '.bz2': b'BZh', '.xz': b'\xfd7zXZ\x00',
+                     '.zst': b'\x28\xb5\x2f\xfd'}
+
+# Extension of the compression of the file (by extension or magic number) or None.
+def Compression(path):
+    ext = os.path.splitext(path)[1]
+    if ext in DECOMPRESSORS:
+        return ext
+    with open(path, 'rb') as file:
+        head = file.read(6)
+    for ext, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return ext
+    return None
+
+# Binary stream of the decompressed contents of the file.
+def OpenDecompressed(path):
+    compression = Compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    return DECOMPRESSORS[compression](path)
+
+# Parse JSON str or bytes with orjson. NaN and Infinity, accepted by the json
+# module, are not supported by orjson, such documents are parsed with json.
+def ParseJson(data):
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+# Order of tetrads in the helix from the list of {"tetrad1": id, "tetrad2": id}
+# pairs of stacked tetrads. Pairs form a single path tetrad1 -> tetrad2, it is
+# returned from its start. Input is not modified.
+def OrderTetradPairs(tetrad_pairs):
+    if tetrad_pairs == None or len(tetrad_pairs) == 0:
+        return []
+    next_tetrad = {}
+    in_degree = {}
+    for pair in tetrad_pairs:
+        first, second = pair["tetrad1"], pair["tetrad2"]
+        if next_tetrad.get(first) == second:
+            # Duplicated pair.
+            continue
+        if first in next_tetrad:
+            raise ValueError("Branching tetrad pairs, {0} is followed by {1} and {2}"
+                             .format(first, next_tetrad[first], second))
+        next_tetrad[first] = second
+        in_degree.setdefault(first, 0)
+        in_degree[second] = in_degree.get(second, 0) + 1
+        if in_degree[second] > 1:
+            raise ValueError("Branching tetrad pairs, {0} is preceded by more than one tetrad"
+                             .format(second))
+
+    starts = [tetrad for tetrad, degree in in_degree.items() if degree == 0]
+    if len(starts) == 0:
+        raise ValueError("Cyclic tetrad pairs")
+    if len(starts) > 1:
+        raise ValueError("Disconnected tetrad pairs, helix starts at {0}".format(starts))
+
+    tetrad_ordered = [starts[0]]
+    while tetrad_ordered[-1] in next_tetrad:
+        tetrad_ordered.append(next_tetrad[tetrad_ordered[-1]])
+    if len(tetrad_ordered) != len(in_degree):
+        # Path from the start does not reach tetrads on a cycle.
+        raise ValueError("Cyclic tetrad pairs")
+    return tetrad_ordered
 
 class Structure:
     def __init__(self):
@@ -532,14 +590,14 @@ class Structure:
     def addNucleotide(self, name, data):
         self.nucleotides[name] = data
 
+    # Reads the file once, gzipped files are recognized by their magic bytes.
     def fromFile(self, path):
-        with open(path) as file:
-            data = json.load(file)
-        return self.fromJsonDict(data)
+        with OpenDecompressed(path) as file:
+            data = file.read()
+        return self.fromJsonDict(ParseJson(data))
 
     def fromString(self, json_string):
-        data = json.loads(json_string)
-        return self.fromJsonDict(data)
+        return self.fromJsonDict(ParseJson(json_string))
 
     def fromJsonDict(self, json_dict):
         for data in json_dict["nucleotides"]:
@@ -564,33 +622,7 @@ class Structure:
                     tracts_all.append(list())
 
             # Order tetrads according to "tetrad_pairs" data.
-            tetrad_pairs = helice["tetradPairs"]
-            tetrad_ordered = []
-            if tetrad_pairs != None and len(tetrad_pairs) > 0:
-                # Add first pair.
-                pair = tetrad_pairs.pop(0)
-                tetrad_ordered.append(pair["tetrad1"])
-                tetrad_ordered.append(pair["tetrad2"])
-                to_remove = 0
-                while len(tetrad_pairs) > 0:
-                    found = False
-                    for index_pair, pair in enumerate(tetrad_pairs):
-                        for index, tetrad in enumerate(tetrad_ordered):
-                            if tetrad == pair["tetrad1"]:
-                                tetrad_ordered.insert(index + 1, pair["tetrad2"])
-                                found = True
-                                break
-                            elif tetrad == pair["tetrad2"]:
-                                tetrad_ordered.insert(index, pair["tetrad1"])
-                                found = True
-                                break
-                        if found == True:
-                            to_remove = index_pair
-                            break
-                    tetrad_pairs.pop(to_remove)
-                    if len(tetrad_pairs) == 0:
-                        break
-
+            tetrad_ordered = OrderTetradPairs(helice["tetradPairs"])
             tetrad_ordered.reverse()
 
             # Do not add single tetrads as quadruplexes.
@@ -2,9 +2,12 @@ import svgwrite
 import sys
 import math
 from enum import Enum
-import cairo
-import tempfile
 import json
+import warnings
+
+import drawtetrado.cairo_writer as cairo_writer
+import drawtetrado.svg_writer as svg_writer
+import drawtetrado.text_metrics as text_metrics
 
 class ConnType(Enum):
     SIMPLE = 1
@@ -28,9 +31,10 @@ class Side(Enum):
     LEFT = -1.0
     NONE = 0.0
 
-class Point(tuple):
-    def __new__(self, x = 0, y = 0):
-        return tuple.__new__(Point, (x, y))
+# Mutable (x, y) pair. Behaves as a sequence of two numbers for svgwrite and
+# the writers, without a tuple and an instance dict per point.
+class Point:
+    __slots__ = ("x", "y")
 
     def __init__(self, x = 0, y = 0):
         self.x = x
@@ -39,11 +43,113 @@ class Point(tuple):
     def __add__(self, rhs):
         return Point(self.x + rhs.x, self.y + rhs.y)
 
+    def __iter__(self):
+        return iter((self.x, self.y))
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, idx):
+        return (self.x, self.y)[idx]
+
+    def __repr__(self):
+        return "Point({0}, {1})".format(self.x, self.y)
+
     def Distance(self, point):
         return math.sqrt(pow(point.y - self.y, 2.0) +
                     pow(point.x - self.x, 2.0))
 
 
+def RGBAtoAlpha(rgba, def_alpha = 0.85):
+    if rgba != None and len(rgba[7:9]) == 2:
+        return float(int(rgba[7:9], 16)) / 255.0
+    return def_alpha
+
+def RGBAtoRGB(rgba):
+    return rgba[0:7]
+
+# Colors of the config resolved once to (RGB, alpha).
+class Palette:
+    def __init__(self, colors, nucl_colors):
+        self.colors = {name: (RGBAtoRGB(rgba), RGBAtoAlpha(rgba)) for name, rgba in colors.items()}
+        self.default = self.colors["n/a"]
+        self.nucl_colors = {name: (RGBAtoRGB(rgba), RGBAtoAlpha(rgba))
+                            for name, rgba in nucl_colors.items()}
+        # Names of CSS classes of the overrides, full names are not valid class names.
+        self.override_names = {name: "override-" + str(idx) for idx, name in enumerate(nucl_colors)}
+
+    def Color(self, name):
+        return self.colors.get(name, self.default)[0]
+
+    def Alpha(self, name):
+        return self.colors.get(name, self.default)[1]
+
+    # Color and alpha of the nucleotide block, ONZ class or override.
+    def Nucleotide(self, nucl):
+        if nucl.full_name in self.nucl_colors:
+            return self.nucl_colors[nucl.full_name]
+        return self.colors.get(nucl.onz, self.default)
+
+    # Name of the nucleotide color used in CSS class names.
+    def NucleotideName(self, nucl):
+        if nucl.full_name in self.override_names:
+            return self.override_names[nucl.full_name]
+        if nucl.onz in self.colors:
+            return nucl.onz
+        return "na"
+
+# Nucleotide blocks of the config, computed once. For ONZ sign ("+" or "-")
+# and position (0-3) of the nucleotide in the tetrad: corners and center of
+# the block at the origin and the shift of the position within the tetrad.
+# Tetrads are stacked every tetrad_step below each other.
+class BlockGeometry:
+    def __init__(self, conf):
+        self.sin_val = math.sin(math.radians(conf.angle))
+        self.cos_val = math.cos(math.radians(conf.angle))
+        self.tan_val = math.tan(math.radians(conf.angle))
+        self.tan_val_rev = math.tan(math.radians(90.0 - conf.angle))
+        self.tetrad_step = self.sin_val * (conf.longer + conf.shorter + conf.spacing) + \
+                           conf.tetrade_spacing
+        self.templates = {}
+        for sign in ("+", "-"):
+            if sign == "-":
+                width_0 = conf.longer
+                height_0 = self.sin_val * conf.shorter
+                width_1 = conf.shorter
+                height_1 = self.sin_val * conf.longer
+            else:
+                width_0 = conf.shorter
+                height_0 = self.sin_val * conf.longer
+                width_1 = conf.longer
+                height_1 = self.sin_val * conf.shorter
+            # (width, height, shift.x, shift.y), None if not shifted.
+            positions = [
+                (width_0, height_0, None, None),
+                (width_1, height_1, (width_1 + conf.spacing) * self.cos_val,
+                 (width_1 + conf.spacing) * self.sin_val),
+                (width_0, height_0, (width_1 + conf.spacing) + \
+                 ((width_0 + conf.spacing) * self.sin_val) * self.tan_val_rev,
+                 (width_0 + conf.spacing) * self.sin_val),
+                (width_1, height_1, width_0 + conf.spacing, None)]
+            for position, (width, height, shift_x, shift_y) in enumerate(positions):
+                coords, center = self.Block(width, height, conf.angle)
+                self.templates[(sign, position)] = (coords, center, shift_x, shift_y)
+
+    # Parallelogram with the bottom left corner at the origin.
+    def Block(self, width, height, angle):
+        if self.tan_val != 0:
+            shift = height / self.tan_val
+        else:
+            shift = height / math.tan(math.radians(0.01))
+        coords = (Point(0.0, 0.0), Point(shift, -height), Point(shift + width, -height),
+                  Point(width, 0.0))
+        return coords, Point((shift + width) / 2.0, -height / 2.0)
+
+# Styling of SVG elements.
+# inline - every element has its own fill, stroke and opacity attributes.
+# css    - elements reference CSS classes defined in a single <style> block.
+SVG_STYLINGS = ("inline", "css")
+
 class Config:
     def __init__(self, scale = 1.0, config_path = None):
         if config_path == None:
@@ -67,6 +173,29 @@ class Config:
         self.font_family = "Arial, Helvetica" if not "font-family" in json_data else json_data["font-family"]
         self.label_font_size = self.scale * (20.0 if not "nucl-font-size" in json_data else json_data["font-family"])
         self.tilted_labels = True if not "tilted-labels" in json_data else json_data["tilted-labels"]
+        # How nucleotide labels are fitted into the blocks: "cairo", "table" or "text-length".
+        self.label_metrics = "cairo" if not "label-metrics" in json_data else json_data["label-metrics"]
+        if self.label_metrics not in text_metrics.METRICS_BACKENDS:
+            raise ValueError("Unknown label-metrics value: " + str(self.label_metrics))
+        # Exact (branch-and-bound) search for tetrad rotations instead of the beam search.
+        self.optimizer_exact = False if not "optimizer-exact" in json_data else json_data["optimizer-exact"]
+        # Threads of the batch optimizer call, 0 for all cores.
+        self.optimizer_threads = 0 if not "optimizer-threads" in json_data else json_data["optimizer-threads"]
+        # SVG writer: "svgwrite" or "stream" (compact, numbers rounded to svg-precision digits).
+        self.svg_writer = "svgwrite" if not "svg-writer" in json_data else json_data["svg-writer"]
+        if self.svg_writer not in svg_writer.WRITERS:
+            raise ValueError("Unknown svg-writer value: " + str(self.svg_writer))
+        self.svg_precision = svg_writer.DEFAULT_PRECISION if not "svg-precision" in json_data else json_data["svg-precision"]
+        self.svg_styling = "inline" if not "svg-styling" in json_data else json_data["svg-styling"]
+        if self.svg_styling not in SVG_STYLINGS:
+            raise ValueError("Unknown svg-styling value: " + str(self.svg_styling))
+        # Output format: "svg", "png" or "pdf" (drawn with cairo). PNG has dpi / 96 pixels per unit.
+        self.output_format = "svg" if not "format" in json_data else json_data["format"]
+        if self.output_format not in cairo_writer.FORMATS:
+            raise ValueError("Unknown format value: " + str(self.output_format))
+        self.dpi = cairo_writer.DEFAULT_DPI if not "dpi" in json_data else json_data["dpi"]
+        # All drawings of a structure in one file: SVG with a group per drawing or multi-page PDF.
+        self.combine = False if not "combine" in json_data else json_data["combine"]
 
         self.label_chain = True if not "label-chain" in json_data else json_data["label-chain"]
         self.label_nucleotide_full = True if not "label-nucl-fullname" in json_data else json_data["label-nucl-fullname"]
@@ -98,11 +227,27 @@ class Config:
         # individual nucleotides
         # "nucl.full_name": "RGBA"
         self.nucl_colors = {} if not "nucl-color-override" in json_data else json_data["nucl-color-override"]
+        self.palette = None
+        self.geometry = None
+
+    # Palette is compiled on first use and shared by all drawings made with
+    # this config. Later changes of colors are not picked up.
+    def Palette(self):
+        if self.palette is None:
+            self.palette = Palette(self.colors, self.nucl_colors)
+        return self.palette
+
+    # Same as the palette, block geometry is computed on first use and does
+    # not follow later changes of sizes or angle.
+    def Geometry(self):
+        if self.geometry is None:
+            self.geometry = BlockGeometry(self)
+        return self.geometry
 
 class SvgMaker:
     def PrepareMarker(self):
         arrowhead = self.svg.marker(insert = (7.6, 4.1), size = (8.0, 6.4), \
-                orient = "auto", markerUnits = "strokeWidth", id = "arrowhead")
+                orient = "auto", markerUnits = "strokeWidth", id = self.id_prefix + "arrowhead")
         arrowhead.add(self.svg.polyline([(0.8, 1.6), (7.6, 4.1), (0.8, 6.4)], \
             stroke = "none", fill = self.GetColor("connection"), \
             fill_opacity = self.GetAlpha("connection")))
@@ -112,11 +257,19 @@ class SvgMaker:
         return Point(width + padding * 2, padding + height)
 
 
-    def __init__(self, config, file_path, quadruplex):
+    # id_prefix is prepended to ids of the elements, so drawings can be
+    # combined into one document. With document (cairo_writer.PdfDocument)
+    # drawing is a new page of the document.
+    def __init__(self, config, file_path, quadruplex, id_prefix = "", document = None):
         self.config = config
         self.quadruplex = quadruplex
-        sin_val = math.sin(math.radians(config.angle))
-        cos_val = math.cos(math.radians(config.angle))
+        self.id_prefix = id_prefix
+        self.palette = config.Palette()
+        # CSS classes used by the drawing, name -> style attributes.
+        self.css_classes = {}
+        geometry = config.Geometry()
+        sin_val = geometry.sin_val
+        cos_val = geometry.cos_val
 
         padding = (config.longer + config.shorter + config.spacing) * sin_val
         padding *= max(len(quadruplex.tetrads) / 5.0, 1.0)
@@ -124,11 +277,25 @@ class SvgMaker:
         height = ((config.longer + config.shorter + config.spacing) * sin_val + \
                    config.tetrade_spacing) * len(quadruplex.tetrads)
 
-        self.cairo_tempfile = tempfile.NamedTemporaryFile(suffix=".svg")
-        self.svg = svgwrite.Drawing(file_path, size = self.GetCanvasSize(padding, height, width), \
-                profile = "full")
+        if document is not None:
+            self.svg = document.NewPage(self.GetCanvasSize(padding, height, width))
+            self.Number = str
+        elif config.output_format != "svg":
+            self.svg = cairo_writer.Drawing(file_path, size = self.GetCanvasSize(padding, height, width), \
+                    format = config.output_format, dpi = config.dpi)
+            self.Number = str
+        elif config.svg_writer == "stream":
+            self.svg = svg_writer.Drawing(file_path, size = self.GetCanvasSize(padding, height, width), \
+                    precision = config.svg_precision)
+            self.Number = self.svg.Number
+        else:
+            self.svg = svgwrite.Drawing(file_path, size = self.GetCanvasSize(padding, height, width), \
+                    profile = "full")
+            self.Number = str
         self.PrepareMarker()
         self.base_shift = Point(padding, padding * 0.5 + height)
+        # Block corners of the nucleotides on the canvas, shifted once in Prepare.
+        self.canvas_coords = {}
 
     def ShiftCoords(self, coords, shift):
         if type(coords) == list:
@@ -139,40 +306,70 @@ class SvgMaker:
         else:
             return coords + shift
 
+    # Corner of the nucleotide block where connections start and end.
+    def Anchor(self, nucl):
+        return self.canvas_coords[nucl][nucl.position]
+
     def RGBAtoAlpha(self, rgba, def_alpha = 0.85):
-        if rgba != None and len(rgba[7:9]) == 2:
-            return float(int(rgba[7:9], 16)) / 255.0
-        return def_alpha
+        return RGBAtoAlpha(rgba, def_alpha)
 
     def RGBAtoRGB(self, rgba):
-        return rgba[0:7]
+        return RGBAtoRGB(rgba)
 
     # Only used for ONZ nucleotide fill or override of the color.
     # Default opacity is 0.85
     def GetAlpha(self, name):
-        return self.RGBAtoAlpha(self.config.colors[name])
+        return self.palette.Alpha(name)
 
     def GetColor(self, name):
-        if name in self.config.colors:
-            return self.RGBAtoRGB(self.config.colors[name])
-        return self.RGBAtoRGB(self.config.colors["n/a"]) # Default color
+        return self.palette.Color(name)
 
     def GetNuclOverride(self, name):
         # We are checking it before running this function but just in case
         # there is some error we want to return default_onz.
-        if name in self.config.nucl_colors:
-            return self.RGBAtoRGB(self.config.nucl_colors[name]), \
-                   self.RGBAtoAlpha(self.config.nucl_colors[name])
-        return self.RGBAtoRGB(self.config.colors["onz_default"]), \
-               self.RGBAtoAlpha(self.config.colors["onz_default"])
+        if name in self.palette.nucl_colors:
+            return self.palette.nucl_colors[name]
+        return self.palette.colors["onz_default"]
+
+    # Style attributes of the element. In "css" styling of SVG output they
+    # are moved to the class and only the class is referenced.
+    def Styled(self, class_name, **attributes):
+        if self.config.svg_styling != "css" or self.config.output_format != "svg":
+            return attributes
+        if class_name not in self.css_classes:
+            self.css_classes[class_name] = attributes
+        return {"class_": class_name}
+
+    def CssValue(self, name, value):
+        if isinstance(value, str):
+            return value
+        if name.endswith("opacity"):
+            return self.Number(value)
+        return self.Number(value) + "px"
+
+    # Single <style> block with all classes used by the drawing.
+    def AddStyle(self):
+        if len(self.css_classes) == 0:
+            return
+        rules = []
+        for class_name, attributes in self.css_classes.items():
+            declarations = []
+            for name, value in attributes.items():
+                if name == "style":
+                    declarations.append(value)
+                else:
+                    name = name.replace("_", "-")
+                    declarations.append(name + ":" + self.CssValue(name, value))
+            rules.append("." + class_name + "{" + ";".join(declarations) + "}")
+        self.svg.defs.add(self.svg.style("\n".join(rules)))
 
     def Prepare(self):
         for name, nucl in self.quadruplex.nucl_quad.items():
             nucl.CalculateCoordinates(self.config)
+            self.canvas_coords[nucl] = self.ShiftCoords(nucl.coords, self.base_shift)
 
         self.quadruplex.DetermineConnectionTypes()
-        for _, chain in self.quadruplex.chains.items():
-            self.quadruplex.CalculateFlow(chain)
+        self.quadruplex.CalculateFlows()
 
 
         for name, nucl in self.quadruplex.nucl_quad.items():
@@ -222,19 +419,18 @@ class SvgMaker:
                 self.DrawLabel(self.quadruplex.nucl_quad[chain["first"]], "5'")
                 self.DrawLabel(self.quadruplex.nucl_quad[chain["last"]], "3'")
 
+        self.AddStyle()
+
     def DrawNucleotide(self, nucl):
-        shift = self.base_shift
         conf = self.config
 
-        color = self.GetColor(nucl.onz)
-        alpha = self.GetAlpha(nucl.onz)
-        # Override colors of the nucleotide if it exists in the nucl_color dict.
-        if nucl.full_name in conf.nucl_colors:
-            color, alpha = self.GetNuclOverride(nucl.full_name)
+        # ONZ color or override of the nucleotide from the nucl_color dict.
+        color, alpha = self.palette.Nucleotide(nucl)
 
-        block = self.svg.polygon(self.ShiftCoords(nucl.coords, shift), \
+        block = self.svg.polygon(self.canvas_coords[nucl], \
+                **self.Styled("block-" + self.palette.NucleotideName(nucl), \
                 fill = color, fill_opacity = alpha, \
-                stroke = color, stroke_width = conf.stroke_width)
+                stroke = color, stroke_width = conf.stroke_width))
 
         self.svg.add(block)
 
@@ -268,17 +464,19 @@ class SvgMaker:
         return name
 
     def ProperFontSize(self, text, fontsize, font, desired_width):
-        surface = cairo.SVGSurface(self.cairo_tempfile.name, 1280, 200)
-        cr = cairo.Context(surface)
-        cr.select_font_face(font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
-        cr.set_font_size(fontsize)
-        xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(text)
-        while width > desired_width:
-            fontsize -= 0.25
-            cr.set_font_size(fontsize)
-            xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(text)
-
-        return fontsize
+        if self.config.label_metrics == "text-length":
+            return fontsize
+        return text_metrics.ProperFontSize(text, font, fontsize, desired_width,
+                                           self.config.label_metrics)
+
+    # Extra label attributes squeezing too wide labels in "text-length" mode.
+    def LabelLength(self, text, fontsize, font, desired_width):
+        if self.config.label_metrics != "text-length":
+            return {}
+        length = text_metrics.TextLength(text, font, fontsize, desired_width)
+        if length is None:
+            return {}
+        return {"textLength": length, "lengthAdjust": "spacingAndGlyphs"}
 
     def DrawNucleotideLabel(self, nucl):
         shift = self.base_shift
@@ -286,10 +484,10 @@ class SvgMaker:
         name = self.NucleotideName(nucl)
         font_family = conf.font_family
         font_size = self.ProperFontSize(name, conf.label_font_size, font_family, conf.longer)
+        label_length = self.LabelLength(name, font_size, font_family, conf.longer)
 
         nucl.center = self.ShiftCoords(nucl.center, shift)
-        tan_val = math.tan(math.radians(conf.angle))
-        sin_val = math.sin(math.radians(conf.angle))
+        sin_val = conf.Geometry().sin_val
 
         if (nucl.GetOnzPlusMinus() == "+" and (nucl.position == 0 or nucl.position == 2)) or \
            (nucl.GetOnzPlusMinus() == "-" and (nucl.position == 1 or nucl.position == 3)):
@@ -310,38 +508,45 @@ class SvgMaker:
             else:
                 skewX = 0
 
-        outer_color = self.GetColor(nucl.onz)
-        # Override colors of the nucleotide if it exists in the nucl_color dict.
-        if nucl.full_name in conf.nucl_colors:
-            outer_color, _ = self.GetNuclOverride(nucl.full_name)
+        # ONZ color or override of the nucleotide from the nucl_color dict.
+        outer_color, _ = self.palette.Nucleotide(nucl)
+        color_name = self.palette.NucleotideName(nucl)
+        bond_name = nucl.bond if nucl.bond in self.palette.colors else "na"
 
-        label_outline = self.svg.text(name, fill = outer_color, \
+        label_outline = self.svg.text(name, \
                 transform = "translate({0}, {1}) rotate({2}) skewX({3})".format( \
-                nucl.center.x, nucl.center.y, rotation, skewX, rotation), \
+                self.Number(nucl.center.x), self.Number(nucl.center.y), rotation, \
+                self.Number(skewX)), \
+                font_size = font_size, **label_length, \
+                **self.Styled("label-outline-" + color_name, fill = outer_color, \
                 style = "text-anchor:middle", \
-                font_weight = "bold", font_size = font_size, font_family = font_family, \
+                font_weight = "bold", font_family = font_family, \
                 stroke = outer_color, stroke_width = "2px", \
-                stroke_linejoin = "round")
+                stroke_linejoin = "round"))
 
-        label_fill = self.svg.text(name, fill = self.GetColor(nucl.bond), \
+        label_fill = self.svg.text(name, \
                 transform = "translate({0}, {1}) rotate({2}) skewX({3})".format( \
-                nucl.center.x, nucl.center.y, rotation, skewX), \
+                self.Number(nucl.center.x), self.Number(nucl.center.y), rotation, \
+                self.Number(skewX)), \
+                font_size = font_size, **label_length, \
+                **self.Styled("label-" + bond_name, fill = self.GetColor(nucl.bond), \
                 style = "text-anchor:middle", \
-                font_weight = "bold", font_size = font_size, font_family = font_family)
+                font_weight = "bold", font_family = font_family))
 
         self.svg.add(label_outline)
         self.svg.add(label_fill)
 
 
     def DrawTetradeBorder(self, nucl_a, quad):
-        point_a = self.ShiftCoords(nucl_a.coords[nucl_a.position], self.base_shift)
+        point_a = self.Anchor(nucl_a)
         nucl_b = quad.nucl_quad[quad.tetrads[nucl_a.tetrade_no][(nucl_a.position + 1) % 4]]
-        point_b = self.ShiftCoords(nucl_b.coords[nucl_b.position], self.base_shift)
+        point_b = self.Anchor(nucl_b)
 
 
-        line = self.svg.polyline([point_a, point_b], stroke = self.GetColor("border"), \
+        line = self.svg.polyline([point_a, point_b], **self.Styled("border", \
+                stroke = self.GetColor("border"), \
                 stroke_width = self.config.stroke_width, fill = "none", \
-                stroke_opacity = self.GetAlpha("border"))
+                stroke_opacity = self.GetAlpha("border")))
 
         self.svg.add(line)
 
@@ -349,7 +554,8 @@ class SvgMaker:
     # For drawinf 5' and 3' labels.
     def DrawLabel(self, nucl, label):
         pos = nucl.position
-        pos_str = self.ShiftCoords(nucl.coords[pos], self.base_shift)
+        corner = self.Anchor(nucl)
+        pos_str = Point(corner.x, corner.y)
         font_size = self.config.se_label_font_size
         pos_str.y += font_size / 5.0
         spacing = self.config.se_label_spacing
@@ -359,16 +565,21 @@ class SvgMaker:
         else:
             pos_str.x += spacing
             anchor = "text-anchor:begin"
-        label_outline = self.svg.text(label, fill = self.GetColor("text"), \
-                transform = "translate({0}, {1})".format(pos_str.x, pos_str.y), \
+        anchor_name = "end" if anchor == "text-anchor:end" else "begin"
+        label_outline = self.svg.text(label, \
+                transform = "translate({0}, {1})".format(self.Number(pos_str.x), \
+                self.Number(pos_str.y)), \
+                **self.Styled("se-label-outline-" + anchor_name, fill = self.GetColor("text"), \
                 style = anchor, font_size = font_size, font_weight = "bold", \
                 font_family = self.config.font_family,
-                stroke = "white", stroke_width = "2px", stroke_linejoin = "round")
+                stroke = "white", stroke_width = "2px", stroke_linejoin = "round"))
 
-        label_fill = self.svg.text(label, fill = self.GetColor("text"), \
-                transform = "translate({0}, {1})".format(pos_str.x, pos_str.y), \
+        label_fill = self.svg.text(label, \
+                transform = "translate({0}, {1})".format(self.Number(pos_str.x), \
+                self.Number(pos_str.y)), \
+                **self.Styled("se-label-" + anchor_name, fill = self.GetColor("text"), \
                 font_family = self.config.font_family,
-                style = anchor, font_size = font_size, font_weight = "bold")
+                style = anchor, font_size = font_size, font_weight = "bold"))
 
         self.svg.add(label_outline)
         self.svg.add(label_fill)
@@ -383,17 +594,18 @@ class SvgMaker:
             midpoint -= 6.0 * conf.stroke_width
 
         line = self.svg.polyline([point_a, (point_a.x, point_a.y - midpoint), point_b], \
+                marker_mid = "url(#" + self.id_prefix + "arrowhead)", **self.Styled("connection", \
                 stroke = self.GetColor("connection"), stroke_width = conf.stroke_width, \
-                fill = "none", marker_mid = "url(#arrowhead)", \
-                stroke_opacity = self.GetAlpha("connection"))
+                fill = "none", stroke_opacity = self.GetAlpha("connection")))
 
         self.svg.add(line)
 
     def DrawSameLevel(self, point_a, point_b, flow_out, flow_in, divisor):
         conf = self.config
-        bezier = self.svg.path(d="M", stroke = self.GetColor("connection"), \
+        bezier = self.svg.path(d="M", **self.Styled("connection", \
+                stroke = self.GetColor("connection"), \
                 stroke_width = conf.stroke_width, fill = "none", \
-                stroke_opacity = self.GetAlpha("connection"))
+                stroke_opacity = self.GetAlpha("connection")))
         distance = point_a.Distance(point_b)
 
         bezier.push(point_a)
@@ -406,9 +618,10 @@ class SvgMaker:
 
     def DrawSide(self, point_a, point_b, flow_out, flow_in, side, angle, divisor):
         conf = self.config
-        bezier = self.svg.path(d="M", stroke = self.GetColor("connection"), \
+        bezier = self.svg.path(d="M", **self.Styled("connection", \
+                stroke = self.GetColor("connection"), \
                 stroke_width = conf.stroke_width, fill = "none", \
-                stroke_opacity = self.GetAlpha("connection"))
+                stroke_opacity = self.GetAlpha("connection")))
         distance = point_a.Distance(point_b)
 
         bezier.push(point_a)
@@ -451,9 +664,9 @@ class SvgMaker:
         if nucl_a.connected_to == "":
             return
 
-        point_a = self.ShiftCoords(nucl_a.coords[nucl_a.position], self.base_shift)
+        point_a = self.Anchor(nucl_a)
         nucl_b = nucl_quad[nucl_a.connected_to]
-        point_b = self.ShiftCoords(nucl_b.coords[nucl_b.position], self.base_shift)
+        point_b = self.Anchor(nucl_b)
 
         flow_out = nucl_a.flow_out
         flow_in = nucl_a.flow_in
@@ -484,7 +697,7 @@ class SvgMaker:
             self.DrawSide(point_a, point_b, flow_out, flow_in, Side.RIGHT, \
                     45, 1.75)
         elif nucl_a.connection_type == ConnType.UNKNOWN:
-            print("WARNINMG: Unknown connection type!")
+            warnings.warn("Unknown connection type!")
             #line = self.svg.polyline([point_a, point_b], fill = "none", \
             #        stroke = self.GetColor("connection"), stroke_width = self.config.stroke_width, \
             #        marker_mid = "url(#arrowhead)", stroke_opacity = 0.95)
@@ -494,9 +707,9 @@ class SvgMaker:
     def DrawNucleotidePoint(self, nucl):
         #print("draw_point")
         conf = self.config
-        point = self.ShiftCoords(nucl.coords[nucl.position], self.base_shift)
-        self.svg.add(self.svg.circle(point, r = conf.point_size, \
+        point = self.Anchor(nucl)
+        self.svg.add(self.svg.circle(point, r = conf.point_size, **self.Styled("point", \
                 stroke = self.GetColor("connection"), stroke_width = conf.point_stroke, \
                 stroke_opacity = self.GetAlpha("connection"), \
-                fill = self.GetColor("point"), fill_opacity = self.GetAlpha("point")))
+                fill = self.GetColor("point"), fill_opacity = self.GetAlpha("point"))))
 
@@ -0,0 +1,162 @@
+import io
+
+# Streaming SVG writer implementing the subset of svgwrite used by SvgMaker
+# (marker, polyline, polygon, path, circle, text, style, defs). Elements are
+# serialized as soon as they are added, there is no DOM, no validation and
+# numbers are written with fixed precision.
+#
+# Writers available for the "svg-writer" config option.
+# svgwrite - svgwrite DOM, pretty-printed.
+# stream   - this module, compact.
+WRITERS = ("svgwrite", "stream")
+DEFAULT_PRECISION = 3
+
+def Escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") \
+               .replace('"', "&quot;")
+
+class Element:
+    def __init__(self, drawing, tag, attributes, text = None):
+        self.drawing = drawing
+        self.tag = tag
+        self.attributes = attributes
+        self.text = text
+        self.children = []
+
+    def add(self, element):
+        self.children.append(element)
+        return element
+
+    def Attributes(self):
+        return self.attributes
+
+    def Write(self, chunks):
+        chunks.append("<" + self.tag)
+        for name, value in self.Attributes():
+            chunks.append(" " + name + '="' + value + '"')
+        if self.text is not None:
+            chunks.append(">" + Escape(self.text) + "</" + self.tag + ">")
+        elif len(self.children) > 0:
+            chunks.append(">")
+            for child in self.children:
+                child.Write(chunks)
+            chunks.append("</" + self.tag + ">")
+        else:
+            chunks.append("/>")
+
+class Path(Element):
+    def __init__(self, drawing, d, attributes):
+        Element.__init__(self, drawing, "path", attributes)
+        self.commands = [d]
+
+    # Same as svgwrite, commands are strings and points are (x, y).
+    def push(self, *elements):
+        number = self.drawing.Number
+        for element in elements:
+            if isinstance(element, str):
+                self.commands.append(element)
+            else:
+                self.commands.append(number(element[0]) + " " + number(element[1]))
+
+    def Attributes(self):
+        return [("d", " ".join(self.commands))] + self.attributes
+
+class Defs:
+    def __init__(self):
+        self.elements = []
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+class Drawing:
+    def __init__(self, filename = None, size = (0, 0), precision = DEFAULT_PRECISION):
+        self.filename = filename
+        self.size = size
+        self.precision = precision
+        self.defs = Defs()
+        # Serialized elements of the body.
+        self.chunks = []
+
+    def Number(self, value):
+        if isinstance(value, int):
+            return str(value)
+        text = "{0:.{1}f}".format(value, self.precision)
+        if "." in text:
+            text = text.rstrip("0").rstrip(".")
+        if text == "-0":
+            text = "0"
+        return text
+
+    def Points(self, points):
+        number = self.Number
+        return " ".join(number(point[0]) + "," + number(point[1]) for point in points)
+
+    # Attributes given as keyword arguments. As in svgwrite, trailing
+    # underscore (class_) is removed and other underscores are replaced with
+    # hyphens.
+    def Attributes(self, attributes):
+        result = []
+        for name, value in attributes.items():
+            if isinstance(value, float) or isinstance(value, int):
+                value = self.Number(value)
+            else:
+                value = Escape(str(value))
+            result.append((name.rstrip("_").replace("_", "-"), value))
+        return result
+
+    def marker(self, insert, size, orient, markerUnits, id):
+        return Element(self, "marker", [
+            ("id", id), ("markerHeight", self.Number(size[1])), ("markerUnits", markerUnits),
+            ("markerWidth", self.Number(size[0])), ("orient", orient),
+            ("refX", self.Number(insert[0])), ("refY", self.Number(insert[1]))])
+
+    def polyline(self, points, **attributes):
+        return Element(self, "polyline", [("points", self.Points(points))] +
+                       self.Attributes(attributes))
+
+    def polygon(self, points, **attributes):
+        return Element(self, "polygon", [("points", self.Points(points))] +
+                       self.Attributes(attributes))
+
+    def path(self, d = "", **attributes):
+        return Path(self, d, self.Attributes(attributes))
+
+    def circle(self, center, r, **attributes):
+        return Element(self, "circle", [("cx", self.Number(center[0])),
+                       ("cy", self.Number(center[1])), ("r", self.Number(r))] +
+                       self.Attributes(attributes))
+
+    def text(self, text, **attributes):
+        return Element(self, "text", self.Attributes(attributes), text)
+
+    def style(self, content):
+        return Element(self, "style", [("type", "text/css")], content)
+
+    # Element is serialized right away, it can not be changed after adding.
+    def add(self, element):
+        element.Write(self.chunks)
+        return element
+
+    def write(self, file, pretty = False):
+        file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        file.write('<svg xmlns="http://www.w3.org/2000/svg" height="{0}" version="1.1" '
+                   'width="{1}">'.format(self.Number(self.size[1]), self.Number(self.size[0])))
+        if len(self.defs.elements) > 0:
+            chunks = ["<defs>"]
+            for element in self.defs.elements:
+                element.Write(chunks)
+            chunks.append("</defs>")
+            file.write("".join(chunks))
+        file.write("".join(self.chunks))
+        file.write("</svg>\n")
+
+    def tostring(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    # Output is always compact, pretty is accepted for svgwrite compatibility.
+    def save(self, pretty = False):
+        with open(self.filename, "w", encoding = "utf-8") as file:
+            self.write(file, pretty)
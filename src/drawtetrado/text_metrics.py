@@ -0,0 +1,102 @@
+import functools
+import importlib.resources
+import json
+import math
+
+# Step used when decreasing the font size until text fits.
+FONT_SIZE_STEP = 0.25
+
+# Label metrics backends.
+# cairo - measure text with cairo using fonts installed in the system.
+# table - use precomputed glyph metrics from data/font_metrics.json, cairo is
+#         not needed.
+# text-length - labels keep the configured size and the ones estimated (using
+#         the table) to be too wide get SVG textLength, so the viewer fits them.
+METRICS_BACKENDS = ("cairo", "table", "text-length")
+DEFAULT_TABLE_FAMILY = "Arial, Helvetica"
+
+class TextMeasure:
+    # Single in-memory surface and context reused for every measurement.
+    def __init__(self):
+        import cairo
+        self.cairo = cairo
+        self.surface = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, None)
+        self.context = cairo.Context(self.surface)
+        self.font = None
+
+    def Width(self, text, font, fontsize):
+        if font != self.font:
+            self.context.select_font_face(font, self.cairo.FONT_SLANT_NORMAL,
+                                          self.cairo.FONT_WEIGHT_BOLD)
+            self.font = font
+        self.context.set_font_size(fontsize)
+        xbearing, ybearing, width, height, xadvance, yadvance = \
+                self.context.text_extents(text)
+        return width
+
+class TableMeasure:
+    # Ink width of the text from per-glyph [advance, xmin, xmax] tables.
+    def __init__(self):
+        data = importlib.resources.files("drawtetrado").joinpath("data", "font_metrics.json")
+        self.tables = json.loads(data.read_text())
+
+    def Width(self, text, font, fontsize):
+        if text == "":
+            return 0.0
+        if font in self.tables:
+            table = self.tables[font]
+        else:
+            table = self.tables[DEFAULT_TABLE_FAMILY]
+        glyphs = table["glyphs"]
+        default = table["default"]
+        first = glyphs.get(text[0], default)
+        last = glyphs.get(text[-1], default)
+        width = -first[1] + last[2]
+        for char in text[:-1]:
+            width += glyphs.get(char, default)[0]
+        return width * fontsize / table["units-per-em"]
+
+_text_measures = {}
+
+def GetTextMeasure(backend = "cairo"):
+    if backend not in _text_measures:
+        if backend == "cairo":
+            _text_measures[backend] = TextMeasure()
+        else:
+            _text_measures[backend] = TableMeasure()
+    return _text_measures[backend]
+
+def StepDown(fontsize, steps):
+    # Repeated subtraction gives the same values as decreasing it step by step.
+    for _ in range(steps):
+        fontsize -= FONT_SIZE_STEP
+    return fontsize
+
+# Largest font size fontsize - k * FONT_SIZE_STEP for which bold text fits into
+# desired_width. Text width is close to linear in the font size, so the
+# size is estimated from a single measurement and only verified afterwards.
+@functools.lru_cache(maxsize = 4096)
+def ProperFontSize(text, font, fontsize, desired_width, backend = "cairo"):
+    measure = GetTextMeasure(backend)
+    width = measure.Width(text, font, fontsize)
+    if width <= desired_width or width <= 0.0:
+        return fontsize
+
+    steps = math.ceil((fontsize - fontsize * desired_width / width) / FONT_SIZE_STEP)
+    steps = max(steps, 1)
+    # Hinting makes width not exactly linear, adjust estimate if needed.
+    while steps > 1 and \
+          measure.Width(text, font, StepDown(fontsize, steps - 1)) <= desired_width:
+        steps -= 1
+    while StepDown(fontsize, steps) > FONT_SIZE_STEP and \
+          measure.Width(text, font, StepDown(fontsize, steps)) > desired_width:
+        steps += 1
+    return StepDown(fontsize, steps)
+
+# Width to which label has to be squeezed using SVG textLength or None if
+# the label fits at the given size. Used by "text-length" backend.
+@functools.lru_cache(maxsize = 4096)
+def TextLength(text, font, fontsize, desired_width):
+    if GetTextMeasure("table").Width(text, font, fontsize) > desired_width:
+        return desired_width
+    return None
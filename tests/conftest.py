@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests run against the source tree, benchmark helpers are in the repo root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,103 @@
+import io
+import math
+import os
+import re
+import struct as binary
+import zlib
+
+import pytest
+
+import drawtetrado.main as main
+import drawtetrado.structure as structure
+import drawtetrado.svg_painter as svg_painter
+
+cairo = pytest.importorskip("cairo")
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PAGE = re.compile(rb"/Type\s*/Page\b(?!s)")
+MEDIA_BOX = re.compile(rb"/MediaBox\s*\[\s*([0-9.\s-]+)\]")
+STREAM = re.compile(rb"stream\r?\n(.*?)endstream", re.DOTALL)
+
+def MakeConfig(output_format, dpi = 96.0):
+    config = svg_painter.Config(1.0)
+    config.output_format = output_format
+    config.dpi = dpi
+    return config
+
+def Example(name):
+    return structure.Structure().fromFile(os.path.join(EXAMPLES, name + ".json"))
+
+# (width, height) of the SVG drawings of the structure, in SVG user units.
+def SvgSizes(struct):
+    return [main.SvgSize(main.SVG_ROOT.search(diagram.data.decode("utf-8")).group(0))
+            for diagram in main.Render(struct, MakeConfig("svg"))]
+
+# Width and height from the IHDR chunk, the first one after the signature.
+def PngSize(data):
+    assert data[12:16] == b"IHDR"
+    return binary.unpack(">II", data[16:24])
+
+# PDF with the compressed streams appended. Since cairo 1.18 objects are
+# stored in compressed object streams.
+def PdfObjects(data):
+    objects = [data]
+    for stream in STREAM.findall(data):
+        try:
+            objects.append(zlib.decompress(stream))
+        except zlib.error:
+            pass
+    return b"\n".join(objects)
+
+def PdfPageCount(data):
+    return len(PAGE.findall(PdfObjects(data)))
+
+# (width, height) in points of every page.
+def PdfPageSizes(data):
+    sizes = []
+    for box in MEDIA_BOX.findall(PdfObjects(data)):
+        x0, y0, x1, y1 = [float(value) for value in box.split()]
+        sizes.append((x1 - x0, y1 - y0))
+    return sizes
+
+@pytest.mark.parametrize("dpi", [96.0, 150.0, 300.0])
+def test_png_size_follows_dpi(dpi):
+    struct = Example("6q6r")
+    diagrams = main.Render(struct, MakeConfig("png", dpi))
+    sizes = SvgSizes(struct)
+    assert len(diagrams) == len(sizes) == len(main.DrawJobs(struct))
+    for diagram, (width, height) in zip(diagrams, sizes):
+        assert diagram.data.startswith(PNG_SIGNATURE)
+        assert PngSize(diagram.data) == (math.ceil(width * dpi / 96.0),
+                                         math.ceil(height * dpi / 96.0))
+        # Something is painted on the transparent background.
+        image = cairo.ImageSurface.create_from_png(io.BytesIO(diagram.data))
+        assert any(bytes(image.get_data()))
+
+def test_pdf_single_page():
+    struct = Example("2hy9")
+    diagrams = main.Render(struct, MakeConfig("pdf"))
+    (width, height), = SvgSizes(struct)
+    assert len(diagrams) == 1
+    data = diagrams[0].data
+    assert data.startswith(b"%PDF-")
+    assert PdfPageCount(data) == 1
+    assert PdfPageSizes(data) == [pytest.approx((width * 0.75, height * 0.75), abs = 1e-3)]
+
+# Combined PDF has one page per drawing, sized as the drawing.
+def test_pdf_combined_pages():
+    struct = Example("6q6r")
+    config = MakeConfig("pdf")
+    config.combine = True
+    data = main.RenderCombined(struct, config)
+    sizes = SvgSizes(struct)
+    assert data.startswith(b"%PDF-")
+    assert PdfPageCount(data) == len(main.DrawJobs(struct)) == len(sizes)
+    assert PdfPageSizes(data) == [pytest.approx((width * 0.75, height * 0.75), abs = 1e-3)
+                                  for width, height in sizes]
+
+def test_png_is_not_combined():
+    config = MakeConfig("png")
+    config.combine = True
+    with pytest.raises(ValueError):
+        main.RenderCombined(Example("2hy9"), config)
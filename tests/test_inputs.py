@@ -0,0 +1,66 @@
+import gzip
+import os
+
+import drawtetrado.main as main
+
+ATOM_SITE = ["group_PDB", "id", "type_symbol", "label_atom_id", "label_comp_id", "label_asym_id",
+             "label_entity_id", "label_seq_id", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy",
+             "auth_seq_id", "auth_comp_id", "auth_asym_id", "pdbx_PDB_model_num"]
+
+# Three guanines of one chain, in PDBx/mmCIF.
+def SmallCif():
+    lines = ["data_TEST", "#", "loop_"] + ["_atom_site." + name for name in ATOM_SITE]
+    serial = 1
+    for residue in range(1, 4):
+        for element, name in (("P", "P"), ("C", "\"C1'\""), ("N", "N9"), ("C", "C4")):
+            lines.append("ATOM {0} {1} {2} DG A 1 {3} {4:.3f} {5:.3f} 1.000 1.00 {3} DG A 1".format(
+                         serial, element, name, residue, 1.5 * residue, 0.7 * serial))
+            serial += 1
+    return "\n".join(lines + ["#", ""])
+
+# Compressed mmCIF is decompressed to a private temporary file, files next to
+# the input (e.g. the same structure uncompressed) are left alone.
+def test_compressed_cif_keeps_directory(tmp_path):
+    text = SmallCif()
+    (tmp_path / "X.cif").write_text(text)
+    with gzip.open(tmp_path / "X.cif.gz", "wt") as file:
+        file.write(text)
+
+    for name in ("X.cif", "X.cif.gz"):
+        structures = main.ReadModels(str(tmp_path / name))
+        assert len(structures[1].residues) == 3
+
+    assert sorted(os.listdir(tmp_path)) == ["X.cif", "X.cif.gz"]
+    assert (tmp_path / "X.cif").read_text() == text
+
+# Inputs of a batch with the same {name} would overwrite each other's
+# drawings, only the first one is kept and the others are reported.
+def test_duplicate_outputs_are_reported(tmp_path):
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "X.json").write_text("{}")
+    (tmp_path / "Y.cif").write_text("")
+    (tmp_path / "Y.cif.gz").write_bytes(gzip.compress(b""))
+    paths = [str(tmp_path / name) for name in ("a/X.json", "Y.cif", "b/X.json", "Y.cif.gz")]
+
+    kept, errors = main.SkipDuplicateOutputs(paths, "/tmp/{name}")
+    assert kept == paths[:2]
+    assert [error["input"] for error in errors] == paths[2:]
+    assert all(error["error"] == "DuplicateOutput" for error in errors)
+    assert paths[0] in errors[0]["message"] and paths[1] in errors[1]["message"]
+
+    # Without the template drawings are saved next to the inputs.
+    kept, errors = main.SkipDuplicateOutputs(paths, None)
+    assert kept == paths and errors == []
+
+# Config and error report in a directory of inputs are not processed.
+def test_directory_skips_other_json(tmp_path):
+    example = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "examples", "2hy9.json")
+    with open(example) as file:
+        (tmp_path / "2hy9.json").write_text(file.read())
+    (tmp_path / "config.json").write_text('{"scale": 1.0}')
+    (tmp_path / "errors.json").write_text("[]")
+    (tmp_path / "broken.json").write_text("{")
+    assert main.ExpandInputs([str(tmp_path)]) == [str(tmp_path / "2hy9.json"),
+                                                  str(tmp_path / "broken.json")]
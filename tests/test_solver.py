@@ -0,0 +1,72 @@
+import random
+import warnings
+
+import pytest
+
+from benchmark_optimizer import RandomProblem
+import drawtetrado.solver as solver
+
+def RandomProblems(count, seed = 7):
+    rng = random.Random(seed)
+    return [RandomProblem(rng, rng.randint(2, 8)) for _ in range(count)]
+
+@pytest.fixture(autouse = True)
+def EmptyCache():
+    solver.ClearCache()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", solver.TractConflictWarning)
+        yield
+    solver.ClearCache()
+
+# Cached beam search has to give the same drawing as the optimizer itself.
+def test_solve_matches_optimizer():
+    optimizer = solver.GetOptimizer()
+    for edges, rotations, alignments in RandomProblems(150):
+        direct = optimizer.solve_stats(list(edges), list(rotations), list(alignments), False)
+        assert solver.Solve(edges, rotations, alignments) == list(direct["positions"])
+
+def test_solve_many_matches_optimizer():
+    optimizer = solver.GetOptimizer()
+    problems = RandomProblems(60, seed = 11)
+    results = solver.SolveMany(problems, num_threads = 1)
+    for (edges, rotations, alignments), positions in zip(problems, results):
+        direct = optimizer.solve_stats(list(edges), list(rotations), list(alignments), False)
+        assert positions == list(direct["positions"])
+
+# Exact search may reverse levels for the cache key, lowest score is the same.
+def test_exact_canonical_score():
+    optimizer = solver.GetOptimizer()
+    for edges, rotations, alignments in RandomProblems(60, seed = 13):
+        key, _ = solver.Canonical(edges, rotations, alignments, exact = True)
+        direct = optimizer.solve_stats(list(edges), list(rotations), list(alignments), True)
+        assert solver.SolveStats(*key, exact = True)["score"] == direct["score"]
+
+def test_cache_hit_for_relabelled_groups():
+    edges, rotations, alignments = RandomProblems(1)[0]
+    shifted_rotations = [group if group == -1 else group + 10 for group in rotations]
+    shifted_alignments = [group if group == -1 else group + 40 for group in alignments]
+    first = solver.Solve(edges, rotations, alignments)
+    second = solver.Solve(edges, shifted_rotations, shifted_alignments)
+    assert first == second
+    assert solver.CacheInfo()["hits"] == 1
+
+# When beam search drops every state keeping the tracts, only the exact
+# search is run, beam search is not repeated.
+def test_failed_beam_falls_back_to_exact(monkeypatch):
+    import drawtetrado.optimizer_numpy as optimizer_numpy
+    edges, rotations, alignments = RandomProblems(1, seed = 3)[0]
+    expected = optimizer_numpy.solve_stats(edges, rotations, alignments, True)
+    search = optimizer_numpy.Search
+    beams = []
+
+    def FailingBeam(*args, **kwargs):
+        if kwargs.get("beam", True):
+            beams.append(args)
+            return {"positions": [], "score": -1, "explored": 0, "pruned": 0}
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(optimizer_numpy, "Search", FailingBeam)
+    result = optimizer_numpy.solve_stats(edges, rotations, alignments, False)
+    assert len(beams) == 1
+    assert result["score"] == expected["score"]
+    assert result["conflicts"] == []
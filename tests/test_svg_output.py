@@ -0,0 +1,124 @@
+import glob
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import drawtetrado.main as main
+import drawtetrado.structure as structure
+import drawtetrado.svg_painter as svg_painter
+import drawtetrado.svg_writer as svg_writer
+import drawtetrado.text_metrics as text_metrics
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+INPUTS = sorted(glob.glob(os.path.join(EXAMPLES, "*.json")))
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:e-?\d+)?")
+
+# Drawings of the input as dict of reference file name -> SVG bytes.
+def RenderExample(path, config):
+    base = os.path.basename(path)[:-len(".json")]
+    struct = structure.Structure().fromFile(path)
+    return {os.path.basename(main.DrawPath(base, diagram.helix, diagram.quadruplex)): diagram.data
+            for diagram in main.Render(struct, config)}
+
+def MakeConfig(writer = "svgwrite", styling = "inline", label_metrics = "table"):
+    config = svg_painter.Config(1.0)
+    config.svg_writer = writer
+    config.svg_styling = styling
+    config.label_metrics = label_metrics
+    return config
+
+def Tag(element):
+    return element.tag.split("}")[-1]
+
+# CSS class name -> {property: value} of the <style> elements.
+def CssRules(root):
+    rules = {}
+    for element in root.iter():
+        if Tag(element) != "style":
+            continue
+        for rule in element.text.strip().split("\n"):
+            name, body = rule[1:].rstrip("}").split("{")
+            rules[name] = dict(declaration.split(":", 1) for declaration in body.split(";"))
+    return rules
+
+# Attributes with CSS class and style declarations expanded, values as
+# (text without numbers and units, numbers).
+def Attributes(element, rules):
+    attributes = dict(element.attrib)
+    if "class" in attributes:
+        attributes.update(rules[attributes.pop("class")])
+    if "style" in attributes:
+        attributes.update(declaration.split(":", 1)
+                          for declaration in attributes.pop("style").split(";"))
+    return {name: (NUMBER.sub("#", value).replace("px", "").replace(" ", ""),
+                   [float(number) for number in NUMBER.findall(value)])
+            for name, value in attributes.items()}
+
+def AssertSameDrawing(expected, actual, expected_rules, actual_rules, tolerance, path):
+    assert Tag(expected) == Tag(actual), path
+    assert (expected.text or "").strip() == (actual.text or "").strip(), path
+    expected_attributes = Attributes(expected, expected_rules)
+    actual_attributes = Attributes(actual, actual_rules)
+    if Tag(expected) == "svg":
+        # Namespaces and profile of the root differ between the writers.
+        names = ["width", "height"]
+    else:
+        assert set(expected_attributes) == set(actual_attributes), path
+        names = list(expected_attributes)
+    for name in names:
+        expected_text, expected_numbers = expected_attributes[name]
+        actual_text, actual_numbers = actual_attributes[name]
+        assert expected_text == actual_text, path + "@" + name
+        assert actual_numbers == pytest.approx(expected_numbers, abs = tolerance), \
+               path + "@" + name
+    expected_children = [child for child in expected if Tag(child) != "style"]
+    actual_children = [child for child in actual if Tag(child) != "style"]
+    assert len(expected_children) == len(actual_children), path
+    for idx, (expected_child, actual_child) in enumerate(zip(expected_children, actual_children)):
+        AssertSameDrawing(expected_child, actual_child, expected_rules, actual_rules, tolerance,
+                          path + "/" + str(idx))
+
+@pytest.fixture(scope = "module")
+def reference_drawings():
+    drawings = {}
+    for path in INPUTS:
+        drawings.update(RenderExample(path, MakeConfig()))
+    return drawings
+
+# Every writer and styling gives well-formed SVG with the same elements,
+# attributes (with CSS classes expanded) and, up to the precision of the
+# writer, the same numbers as svgwrite with inline styling.
+@pytest.mark.parametrize("writer", svg_writer.WRITERS)
+@pytest.mark.parametrize("styling", svg_painter.SVG_STYLINGS)
+def test_writers_and_stylings(reference_drawings, writer, styling):
+    config = MakeConfig(writer, styling)
+    tolerance = 10.0 ** -config.svg_precision if writer == "stream" else 1e-9
+    drawings = {}
+    for path in INPUTS:
+        drawings.update(RenderExample(path, config))
+    assert set(drawings) == set(reference_drawings)
+    for name, data in drawings.items():
+        root = ET.fromstring(data)
+        expected = ET.fromstring(reference_drawings[name])
+        if styling == "css":
+            assert any(Tag(element) == "style" for element in root.iter())
+        AssertSameDrawing(expected, root, CssRules(expected), CssRules(root), tolerance, name)
+
+# Default config (svgwrite, inline styling, labels measured with cairo)
+# reproduces the committed example drawings. Label sizes depend on the fonts
+# installed in the system, the examples were drawn with Arial, which the
+# metrics table describes.
+def test_default_output_matches_examples():
+    pytest.importorskip("cairo")
+    config = svg_painter.Config(1.0)
+    probe = "ABCDEFGHIJKLMNOPQRSTUVWXYZ.0123456789"
+    width = text_metrics.GetTextMeasure("cairo").Width(probe, config.font_family, 20.0)
+    if width != pytest.approx(text_metrics.GetTextMeasure("table").Width(
+                              probe, config.font_family, 20.0), rel = 0.02):
+        pytest.skip("fonts of the examples are not installed")
+    for path in INPUTS:
+        for name, data in RenderExample(path, config).items():
+            with open(os.path.join(EXAMPLES, name), "rb") as file:
+                assert data == file.read(), name